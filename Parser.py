@@ -1,18 +1,23 @@
-import requests
+import asyncio
+import httpx
 from datetime import datetime
-import openpyxl
-from openpyxl.styles import Alignment
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import io
 import json
-import threading
 import time
-import os
+from functools import partial
 from pprint import pprint
-import warnings
-from urllib3.exceptions import InsecureRequestWarning
 from kladr_dict import KLADR_CODES
-from config import TOKEN
 from config import TEMPLATE_PATH
+from report_writer import ReportWriter
+from tenderplan_api import get_client
+from pagination import collect_previews
+from rate_limiter import api_limiter
+from concurrency import detail_concurrency
+from resilience import CircuitOpenError
+from tender_cache import detail_cache
+from report_snapshot import preview_fingerprint, load_snapshot, save_snapshot
+from metrics import REPORT_STAGE_SECONDS
+from profiling import ProfileRun, start_run, profiled_section
 # ─── Справочник статусов внутри кода ───────────────────────────────────
 STATUS_LOOKUP = {
     1: "Прием заявок",
@@ -44,137 +49,89 @@ PLACINGWAY_LOOKUP = {
 # инвертируем KLADR_CODES: из кода региона (первые две цифры) → название
 REGION_LOOKUP = {int(code[:2]): name for name, code in KLADR_CODES.items()}
 
-# ─── Отключаем HTTPS-спам ─────────────────────────────────────────────
-warnings.simplefilter('ignore', InsecureRequestWarning)
-
-BASE_URL = 'https://tenderplan.ru/api'
-REPORTS_DIR   = os.path.join(os.path.dirname(__file__), "reports")
-
-headers = {
-    'Authorization': f'Bearer {TOKEN}',
-    'Accept': 'application/json',
-    'Content-Type':  'application/json'}
-
-session = requests.Session()
-session.headers.update(headers) 
-
-
-MAX_REQUESTS_PER_10_SECONDS = 250
-TIME_WINDOW = 10.0  # секунд
-
-lock = threading.Lock()
-request_timestamps = []
-
-def wait_for_rate_limit():
-    with lock:
-        now = time.time()
-        # Удаляем устаревшие отметки (старше 10 секунд)
-        while request_timestamps and request_timestamps[0] < now - TIME_WINDOW:
-            request_timestamps.pop(0)
-        # Если достигли лимита, ждем, пока освободится окно
-        if len(request_timestamps) >= MAX_REQUESTS_PER_10_SECONDS:
-            sleep_time = TIME_WINDOW - (now - request_timestamps[0])
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-        # Регистрируем новый запрос
-        request_timestamps.append(time.time())
-
-
-def generate_report(key_id: str) -> str:
+async def generate_report(key_id: str, executor=None) -> tuple[io.BytesIO, int]:
     """
     Генерирует Excel-отчёт по tenderplan-ключу key_id.
-    Возвращает путь к сохранённому файлу.
+    Сборка книги выполняется в executor (пул процессов или потоков; по умолчанию — пул loop'а).
+    Возвращает (буфер с xlsx, максимальная дата публикации); имя файла — buffer.name,
+    а buffer.missing — сколько тендеров попало в отчёт только по превью, потому что
+    API не отдал их детали (0 — отчёт полный).
+    Этапы прогона пишутся в метрики и, если включён PROFILE_LOG, в профиль (см. profiling).
     """
-    os.makedirs(REPORTS_DIR, exist_ok=True)
-
-        # 1) Получаем список всех тендеров с пагинацией
-    # ─── 2. Пагинация по /api/tenders/getlist с page/size ────────────────
-    all_tenders = []
-    page = 0
-    size = 50  # сколько тендеров за 1 запрос
-
-    while True:
-        resp = requests.get(
-            f"{BASE_URL}/tenders/v2/getlist",
-            headers=headers,
-            params={
-            'type': 0,
-            'id': key_id,
-            'statuses': [1],
-            'page': page,
-            'size': size
-        },
-            verify=False
-        )
-        resp.raise_for_status()
-        raw_batch = resp.json().get('tenders', [])
-        # вручную фильтруем, чтобы точно остались только "Подача заявок"
-        now_ts = int(datetime.now().timestamp() * 1000)
-        batch = [
-            t for t in raw_batch
-            if t.get("status") == 1 and
-            (t.get("submissionCloseDateTime") or t.get("submissionCloseDate") or 0) > now_ts
-        ]
-        if not batch:
-            break
-        all_tenders.extend(batch)
-        page += 1
-        # если пришло меньше, чем запрошено — значит это последняя страница
-        if len(raw_batch) < size:
-            break
+    run = start_run("report", key_id=key_id)
+    try:
+        return await _collect_report(key_id, executor, run)
+    except Exception as e:
+        run.error = repr(e)
+        raise
+    finally:
+        run.finish()
+
+
+async def _collect_report(key_id: str, executor, run: ProfileRun) -> tuple[io.BytesIO, int]:
+    client = get_client()
+
+    def stage_done(stage: str, **extra):
+        # длительность этапа — в метрику report_stage_seconds и в профиль прогона
+        REPORT_STAGE_SECONDS.observe(run.mark(stage, **extra), stage)
 
+    # 1) Превью всех открытых тендеров: страницы параллельно, без повторов (см. pagination)
+    all_tenders = await collect_previews(key_id, require_status=1)
     print(f"Всего тендеров после пагинации: {len(all_tenders)}")
+    stage_done("list")
 
-    seen = set()
-    unique_tenders = []
-    for t in all_tenders:
-        tid = t.get('_id')
-        if tid in seen:
-            continue
-        seen.add(tid)
-        unique_tenders.append(t)
-    all_tenders = unique_tenders
-    print(f"После удаления дубликатов: {len(all_tenders)} тендеров")
+    # 2) Для каждого preview делаем detail-запрос и сохраняем в новом списке;
+    # сколько их идёт одновременно, решает общий адаптивный предел (concurrency.detail_concurrency)
+    # Повторы и паузы — в клиенте (resilience); если деталь так и не загрузилась,
+    # отчёт не прерывается: строка тендера собирается из превью, а сам отчёт помечается неполным.
+    missing = []
 
-    # 2) Для каждого preview делаем detail-запрос и сохраняем в новом списке
-    def fetch_detail(preview):
+    async def fetch_detail(preview, use_cache=True):
         rel_id = preview["_id"]
-        for attempt in range(5):
-            try:
-                wait_for_rate_limit()
-                r = session.get(
-                    f"{BASE_URL}/tenders/get",
-                    params={'id': rel_id},
-                    verify=False
-                )
-                if r.status_code == 429:
-                    # При 429 ждем с экспоненциальной задержкой
-                    time.sleep(1 * (attempt + 1))
-                    continue
-                r.raise_for_status()
-                det = r.json()
-                # если вам нужен исходный статус для lookup'а:
-                det["_preview_status"] = preview.get("status", 0)
-                return det
-            except requests.HTTPError as e:
-                print(f"HTTPError при загрузке тендера {rel_id}: {e}")
-                if attempt == 4:
-                    raise
-                time.sleep(1 * (attempt + 1))
-            except Exception as e:
-                print(f"Ошибка при загрузке тендера {rel_id}: {e}")
-                if attempt == 4:
-                    raise
-                time.sleep(1 * (attempt + 1))
-        raise Exception(f"Не удалось получить данные тендера {rel_id} после 5 попыток")
-    # загружаем детали в параллельных потоках
-    detailed = []
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = [executor.submit(fetch_detail, t) for t in all_tenders]
-        for fut in as_completed(futures):
-            detailed.append(fut.result())
+        try:
+            det = await client.get_tender(rel_id, use_cache=use_cache)
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            print(f"Не удалось загрузить тендер {rel_id}, в отчёт идёт превью: {e}")
+            missing.append(rel_id)
+            det = dict(preview, _partial=True)
+        # если вам нужен исходный статус для lookup'а:
+        det["_preview_status"] = preview.get("status", 0)
+        return det
+    # Инкрементальность: деталь берём из снимка прошлого отчёта, если превью не изменилось.
+    # Новые тендеры грузим (в т.ч. из кэша деталей), изменившиеся — в обход кэша.
+    snapshot = load_snapshot(key_id)
+    by_id = {}
+    new_ids, changed_ids = [], []
+    for t in all_tenders:
+        prev = snapshot.get(t["_id"])
+        if prev is None:
+            new_ids.append(t)
+        elif prev[0] != preview_fingerprint(t):
+            changed_ids.append(t)
+        else:
+            det = prev[1]
+            det["_preview_status"] = t.get("status", 0)
+            by_id[t["_id"]] = det
+    print(f"Из снимка: {len(by_id)}, новых: {len(new_ids)}, изменившихся: {len(changed_ids)}")
+    stage_done("snapshot_load")
+
+    # загружаем детали параллельно
+    fetched = await asyncio.gather(
+        *(fetch_detail(t) for t in new_ids),
+        *(fetch_detail(t, use_cache=False) for t in changed_ids),
+    )
+    for t, det in zip(new_ids + changed_ids, fetched):
+        by_id[t["_id"]] = det
+    detailed = [by_id[t["_id"]] for t in all_tenders]
+    stage_done("details", missing=len(missing))
+    # неполные строки в снимок не попадают — в следующем отчёте их детали загрузятся заново
+    save_snapshot(key_id, [(t, by_id[t["_id"]]) for t in all_tenders if not by_id[t["_id"]].get("_partial")])
+    stage_done("snapshot_save")
 
     print("Получено детальных моделей тендеров:", len(detailed))
+    print("Ожидание квоты API:", api_limiter.stats())
+    print("Параллельность деталей:", detail_concurrency.stats())
+    print("Кэш деталей:", detail_cache.stats())
     # найдём максимальное время публикации среди тех, что попали в отчёт
     max_pub = max((d.get("publicationDate", 0) for d in detailed), default=0)
     # >>>> ДОБАВЛЯЕМ ЛОГ ДЛЯ ВЫВОДА ДАТ ПУБЛИКАЦИИ ВСЕХ ТЕНДЕРОВ <<<<
@@ -187,170 +144,216 @@ def generate_report(key_id: str) -> str:
         else:
             print(f"{det.get('number', det.get('_id'))}: дата не указана")
 
-    # ─── 3. Открываем шаблон и очищаем предыдущие строки ───────────────────
-    wb = openpyxl.load_workbook(TEMPLATE_PATH)
-    ws = wb.active
-    for row in ws.iter_rows(min_row=3, max_row=ws.max_row):
-        for cell in row:
-            cell.value = None
-            if hasattr(cell, 'hyperlink'):
-                cell.hyperlink = None
-
-    # ─── 4. Заполняем Excel (H — сразу maxPrice из getlist) ───────────────
-    for idx, det in enumerate(detailed, start=3):
-        _id      = det.get("_id")
-        num      = det.get("number", _id)
-        order    = det.get("orderName", "")
-        price    = det.get("maxPrice", "") 
-        if price is None or price == "":
-            ws[f'I{idx}'] = "не установлена"
-        else:
-            ws[f'I{idx}'] = price             
-        pub_dt   = datetime.fromtimestamp(det.get("publicationDate",0)/1000) if det.get("publicationDate") else ""
-        close_ts = det.get("submissionCloseDateTime") or det.get("submissionCloseDate", 0)
-        close_dt = datetime.fromtimestamp(close_ts/1000) if close_ts else ""
-        customers = det.get('customers', [])
-        customer_name = customers[0]["name"] if customers else ""
-        ws[f'Q{idx}'] = customer_name
-        # ЭТП
-        plat = det.get('platform', {})
-
-        #app_url = f"https://tenderplan.ru/app?key={key_id}&tender={_id}"
-
-        ws[f'C{idx}'] = num
-        ws[f'B{idx}'] = order
-        ws[f'H{idx}'] = price                         # <— здесь
-
-        # F: «ЕИС» – гиперссылка на ЕИС
-        eis_link = det.get("href", "")
-        if eis_link:
-            ws[f'G{idx}'] = "Ссылка на тендер"
-            ws[f'G{idx}'].hyperlink = eis_link
-        else:
-            ws[f'G{idx}'] = ""
-
-        ws[f'A{idx}'] = pub_dt
-
-        ws[f'H{idx}'] = plat.get("name", "")
-        ws[f'H{idx}'].hyperlink = plat.get("href", "")
-
-        ws[f'E{idx}'] = STATUS_LOOKUP.get(det.get("status"), "")
-            # 1. получаем код ФЗ
-        fz_id = det.get("type")  
-        fz = FZ_LOOKUP.get(fz_id, "")
-
-        # 2. получаем shortName типа торгов, как у вас было
-        placing_code = det.get("placingWay")
-        placing = ""
-        if isinstance(placing_code, int):
-            placing = PLACINGWAY_LOOKUP.get(placing_code, "")
-        elif str(placing_code).isdigit():
-            placing = PLACINGWAY_LOOKUP.get(int(placing_code), "")
-
-        # 3. записываем в ячейку "Тип торгов"
-        ws[f'F{idx}'] = " ".join(str(part) for part in (fz, placing) if part)
-        prov = det.get('guaranteeProv')
-        if prov is None or prov == "":
-            ws[f'O{idx}'] = "не указано"
-        else:
-            ws[f'O{idx}'] = prov
-        # ─── ОКПД2 ────────────────────────────────────────────────────────
-        okpd2 = det.get("okpd2", "")
-        if isinstance(okpd2, list):
-            first = okpd2[0] if okpd2 else ""
-            if isinstance(first, dict):
-                okpd2_code = first.get("code", "") or first.get("fv", "")  # в зависимости от структуры
-            else:
-                okpd2_code = str(first)
+    # сборка книги openpyxl — CPU-работа, уводим её из event loop
+    run.reset_mark()
+    report = await asyncio.get_running_loop().run_in_executor(
+        executor, partial(build_workbook, detailed, cprofile=run.cprofile, trace_memory=run.enabled)
+    )
+    # книга могла собираться в другом процессе — её этапы, пик памяти и дамп cProfile
+    # приходят вместе с буфером
+    for stage, seconds in report.timings.items():
+        REPORT_STAGE_SECONDS.observe(seconds, f"workbook_{stage}")
+    run.attach_dump(report.profile.get("cprofile"))
+    stage_done(
+        "workbook",
+        **{f"workbook_{stage}": round(s, 4) for stage, s in report.timings.items()},
+        **{k: v for k, v in report.profile.items() if k != "cprofile"},
+    )
+    report.missing = len(missing)
+    REPORT_STAGE_SECONDS.observe(time.perf_counter() - run.started, "total")
+    return report, max_pub
+
+
+def tender_row(det: dict, timings: dict | None = None) -> tuple[dict, dict, dict]:
+    """
+    Раскладывает детальную модель тендера по столбцам шаблона форма.xlsx.
+    Возвращает (значения, гиперссылки, форматы чисел) — словари по букве столбца.
+    В timings["contacts"], если передан, добавляется время разбора контактов.
+    """
+    row: dict = {}
+    links: dict[str, str] = {}
+    formats: dict[str, str] = {}
+    _id      = det.get("_id")
+    num      = det.get("number", _id)
+    order    = det.get("orderName", "")
+    price    = det.get("maxPrice", "") 
+    if price is None or price == "":
+        row['I'] = "не установлена"
+    else:
+        row['I'] = price             
+    pub_dt   = datetime.fromtimestamp(det.get("publicationDate",0)/1000) if det.get("publicationDate") else ""
+    close_ts = det.get("submissionCloseDateTime") or det.get("submissionCloseDate", 0)
+    close_dt = datetime.fromtimestamp(close_ts/1000) if close_ts else ""
+    customers = det.get('customers', [])
+    customer_name = customers[0]["name"] if customers else ""
+    row['Q'] = customer_name
+    # ЭТП
+    plat = det.get('platform', {})
+
+    #app_url = f"https://tenderplan.ru/app?key={key_id}&tender={_id}"
+
+    row['C'] = num
+    row['B'] = order
+    row['H'] = price                         # <— здесь
+
+    # F: «ЕИС» – гиперссылка на ЕИС
+    eis_link = det.get("href", "")
+    if eis_link:
+        row['G'] = "Ссылка на тендер"
+        links['G'] = eis_link
+    else:
+        row['G'] = ""
+
+    row['A'] = pub_dt
+
+    row['H'] = plat.get("name", "")
+    links['H'] = plat.get("href", "")
+
+    row['E'] = STATUS_LOOKUP.get(det.get("status"), "")
+        # 1. получаем код ФЗ
+    fz_id = det.get("type")  
+    fz = FZ_LOOKUP.get(fz_id, "")
+
+    # 2. получаем shortName типа торгов, как у вас было
+    placing_code = det.get("placingWay")
+    placing = ""
+    if isinstance(placing_code, int):
+        placing = PLACINGWAY_LOOKUP.get(placing_code, "")
+    elif str(placing_code).isdigit():
+        placing = PLACINGWAY_LOOKUP.get(int(placing_code), "")
+
+    # 3. записываем в ячейку "Тип торгов"
+    row['F'] = " ".join(str(part) for part in (fz, placing) if part)
+    prov = det.get('guaranteeProv')
+    if prov is None or prov == "":
+        row['O'] = "не указано"
+    else:
+        row['O'] = prov
+    # ─── ОКПД2 ────────────────────────────────────────────────────────
+    okpd2 = det.get("okpd2", "")
+    if isinstance(okpd2, list):
+        first = okpd2[0] if okpd2 else ""
+        if isinstance(first, dict):
+            okpd2_code = first.get("code", "") or first.get("fv", "")  # в зависимости от структуры
         else:
-            okpd2_code = str(okpd2)
-        ws[f'D{idx}'] = okpd2_code
+            okpd2_code = str(first)
+    else:
+        okpd2_code = str(okpd2)
+    row['D'] = okpd2_code
+
+    # Обеспечение контракта
+    contract_guarantee = det.get('guaranteeContract')
+    if contract_guarantee is None or contract_guarantee == 0:
+        row['K'] = "указано в документации"
+    else:
+        row['K'] = contract_guarantee
+
+    app_guarantee = det.get('guaranteeApp')
+    if app_guarantee is None or app_guarantee == 0:
+        row['J'] = "не требуется"
+    else:
+        row['J'] = app_guarantee
+
+    row['L'] = det.get("currency", "")
+    row['M'] = close_dt
+    formats['M'] = 'DD.MM.YYYY HH:MM'
+    region_id = det.get("region")  # это целое число, например 23
+    row['P'] = REGION_LOOKUP.get(region_id, "")
+    sum_ts = det.get("summingUpDateTime")  # миллисекунды с эпохи, например 1690000000000
+    if sum_ts:
+        sum_dt = datetime.fromtimestamp(sum_ts / 1000)
+        row['N'] = sum_dt
+        formats['N'] = 'DD.MM.YYYY HH:MM'
+    else:
+        # если нет даты/времени — выводим текст по документации
+        row['N'] = "В соответствии с документацией о закупке"
+        # выставляем формат «текст», чтобы Excel не пытался разобрать фразу как дату
+        formats['N'] = '@'
+    #Документы к закупке  
+    #atts = det.get("attachments", [])
+    #cell = ws[f'R{idx}']
+    #if atts:
+    #    lines = []
+    #    for a in atts:
+    #        url  = a.get("href", "")
+     #       name = a.get("displayName", url)
+    #        lines.append(f"{name}: {url}")
+     #   cell.value = "\n".join(str(line) for line in lines if line is not None and line != "")
+     #   cell.alignment = Alignment(wrap_text=True, vertical='top')
+    #    cell.number_format = 'General'    # <-- важно!
+    #else:
+      #  cell.value = ""
+    # ─── Контакты заказчика ────────────────────────────────────────────
+    contacts_started = time.perf_counter()
+    raw = det.get("json", "")
+    try:
+        nested = json.loads(raw) if raw else {}
+    except json.JSONDecodeError:
+        nested = {}
+
+    contacts_fv = nested.get("2", {}).get("fv", {})
+    lines = []
+
+    # Организация
+    org = contacts_fv.get("0", {}).get("fv", "")
+    if org:
+        lines.append(org)
+
+    # Фактический / почтовый адрес
+    fact = contacts_fv.get("1", {}).get("fv", "")
+    post = contacts_fv.get("2", {}).get("fv", "")
+    if fact or post:
+        lines.append(fact or post)
+
+    # Массив контактов: FIO, Phone, Email
+    for entry in contacts_fv.get("3", {}).get("fv", {}).values():
+        fn = entry.get("fn")
+        fv = entry.get("fv", "")
+        if not fv:
+            continue
+        if fn == "FIO":
+            lines.append(f"Контактное лицо: {fv}")
+        elif fn == "Phone":
+            lines.append(f"Телефон: {fv}")
+        elif fn == "Email":
+            lines.append(f"E-mail: {fv}")
 
-        # Обеспечение контракта
-        contract_guarantee = det.get('guaranteeContract')
-        if contract_guarantee is None or contract_guarantee == 0:
-            ws[f'K{idx}'] = "указано в документации"
-        else:
-            ws[f'K{idx}'] = contract_guarantee
+    # Записываем в ячейку (например, столбец V), включаем переносы
+    row['R'] = "\n".join(str(line) for line in lines if line is not None and line != "")
+    # перенос строк в столбце R задан стилем строки шаблона
+    if timings is not None:
+        timings["contacts"] += time.perf_counter() - contacts_started
 
-        app_guarantee = det.get('guaranteeApp')
-        if app_guarantee is None or app_guarantee == 0:
-            ws[f'J{idx}'] = "не требуется"
-        else:
-            ws[f'J{idx}'] = app_guarantee
-
-        ws[f'L{idx}'] = det.get("currency", "")
-        ws[f'M{idx}'] = close_dt
-        ws[f'M{idx}'].number_format = 'DD.MM.YYYY HH:MM'
-        region_id = det.get("region")  # это целое число, например 23
-        ws[f'P{idx}'] = REGION_LOOKUP.get(region_id, "")
-        sum_ts = det.get("summingUpDateTime")  # миллисекунды с эпохи, например 1690000000000
-        if sum_ts:
-            sum_dt = datetime.fromtimestamp(sum_ts / 1000)
-            ws[f'N{idx}'] = sum_dt
-            ws[f'N{idx}'].number_format = 'DD.MM.YYYY HH:MM'
-        else:
-            # если нет даты/времени — выводим текст по документации
-            ws[f'N{idx}'] = "В соответствии с документацией о закупке"
-            # выставляем формат «текст», чтобы Excel не пытался разобрать фразу как дату
-            ws[f'N{idx}'].number_format = '@'
-        #Документы к закупке  
-        #atts = det.get("attachments", [])
-        #cell = ws[f'R{idx}']
-        #if atts:
-        #    lines = []
-        #    for a in atts:
-        #        url  = a.get("href", "")
-         #       name = a.get("displayName", url)
-        #        lines.append(f"{name}: {url}")
-         #   cell.value = "\n".join(str(line) for line in lines if line is not None and line != "")
-         #   cell.alignment = Alignment(wrap_text=True, vertical='top')
-        #    cell.number_format = 'General'    # <-- важно!
-        #else:
-          #  cell.value = ""
-        # ─── Контакты заказчика ────────────────────────────────────────────
-        raw = det.get("json", "")
-        try:
-            nested = json.loads(raw) if raw else {}
-        except json.JSONDecodeError:
-            nested = {}
-
-        contacts_fv = nested.get("2", {}).get("fv", {})
-        lines = []
-
-        # Организация
-        org = contacts_fv.get("0", {}).get("fv", "")
-        if org:
-            lines.append(org)
-
-        # Фактический / почтовый адрес
-        fact = contacts_fv.get("1", {}).get("fv", "")
-        post = contacts_fv.get("2", {}).get("fv", "")
-        if fact or post:
-            lines.append(fact or post)
-
-        # Массив контактов: FIO, Phone, Email
-        for entry in contacts_fv.get("3", {}).get("fv", {}).values():
-            fn = entry.get("fn")
-            fv = entry.get("fv", "")
-            if not fv:
-                continue
-            if fn == "FIO":
-                lines.append(f"Контактное лицо: {fv}")
-            elif fn == "Phone":
-                lines.append(f"Телефон: {fv}")
-            elif fn == "Email":
-                lines.append(f"E-mail: {fv}")
-
-        # Записываем в ячейку (например, столбец V), включаем переносы
-        cell = ws[f'R{idx}']
-        cell.value = "\n".join(str(line) for line in lines if line is not None and line != "")
-        cell.alignment = Alignment(wrap_text=True)
-
-    # ─── 5. Сохраняем ───────────────────────────────────────────────────────
-    now = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"тендеры_{now}.xlsx"
-    out_path = os.path.join(REPORTS_DIR, filename)
-    wb.save(out_path)
-
-    return out_path, max_pub
\ No newline at end of file
+    return row, links, formats
+
+
+def build_workbook(detailed: list[dict], cprofile: bool = False, trace_memory: bool = False) -> io.BytesIO:
+    """
+    Потоково пишет отчёт по шаблону форма.xlsx в буфер в памяти.
+    Имя файла для отправки — в атрибуте name буфера, длительности этапов
+    (rows — разбор строк, в т.ч. contacts — контактов, fill — запись строк, save) — в timings.
+    Сборка идёт в пуле потоков или процессов, поэтому профилируется здесь же
+    (cprofile, trace_memory — см. profiling.profiled_section); итог — в атрибуте profile.
+    """
+    timings = {"rows": 0.0, "contacts": 0.0, "fill": 0.0, "save": 0.0}
+    with profiled_section("workbook", cprofile, trace_memory) as profile:
+        writer = ReportWriter(TEMPLATE_PATH)
+        for det in detailed:
+            started = time.perf_counter()
+            values = tender_row(det, timings)
+            parsed = time.perf_counter()
+            writer.write_row(*values)
+            timings["rows"] += parsed - started
+            timings["fill"] += time.perf_counter() - parsed
+
+        # ─── 5. Сохраняем ───────────────────────────────────────────────────────
+        now = datetime.now().strftime("%Y%m%d_%H%M%S")
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        writer.save(buffer)
+        timings["save"] = time.perf_counter() - started
+    buffer.seek(0)
+    buffer.name = f"тендеры_{now}.xlsx"
+    buffer.timings = timings
+    buffer.profile = profile
+    return buffer
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from config import ATTACHMENT_CACHE_SIZE, ATTACHMENT_CACHE_TTL, SENT_LEGACY_TTL_DAYS
+from database import get_connection
+
+
+def attachment_rows(tender_id: str, attachments: list[dict],
+                    close_ts: int | None = None) -> list[tuple[str, str, str, int | None]]:
+    """
+    Строки (tender_id, file_name, url, close_ts) для таблицы attachments;
+    вложения без ссылки пропускаются.
+    """
+    rows = []
+    for att in attachments:
+        file_name = att.get("displayName") or att.get("fileName") or "Файл"
+        url = att.get("href") or att.get("url")
+        if url:  # сохраняем только если есть ссылка
+            rows.append((tender_id, file_name, url, close_ts))
+    return rows
+
+
+class AttachmentStore:
+    """
+    Списки документов тендеров для кнопок «📎 Документы» — общие для выгрузки
+    сообщениями и рассылки подписок.
+
+    Источник истины — таблица attachments (переживает перезапуск, чистится
+    вместе с sent_tenders после окончания приёма заявок). В памяти — небольшой
+    LRU последних списков: не больше max_size тендеров, каждый не дольше max_age секунд.
+    """
+
+    def __init__(self, max_size: int = ATTACHMENT_CACHE_SIZE, max_age: float = ATTACHMENT_CACHE_TTL):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._items: OrderedDict[str, tuple[float, list[tuple[str, str]]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+
+    def _remember(self, tender_id: str, docs: list[tuple[str, str]]):
+        with self._lock:
+            self._items[tender_id] = (time.monotonic(), docs)
+            self._items.move_to_end(tender_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def _evict_old(self):
+        border = time.monotonic() - self.max_age
+        with self._lock:
+            # порядок LRU почти совпадает с порядком записи — старые записи в начале
+            while self._items:
+                tid, (stored_at, _) = next(iter(self._items.items()))
+                if stored_at > border:
+                    break
+                del self._items[tid]
+
+    def put_many(self, items: list[tuple[str, list[dict], int | None]]):
+        """
+        Сохраняет вложения пачки тендеров [(tender_id, вложения, close_ts)] одной транзакцией.
+        Без close_ts запись живёт SENT_LEGACY_TTL_DAYS дней.
+        """
+        default_close = int((time.time() + SENT_LEGACY_TTL_DAYS * 86400) * 1000)
+        rows = [
+            row for tid, atts, close_ts in items
+            for row in attachment_rows(tid, atts, close_ts or default_close)
+        ]
+        if rows:
+            with get_connection() as conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO attachments (tender_id, file_name, url, close_ts) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+        self._evict_old()
+        for tid, atts, _ in items:
+            self._remember(tid, [(name, url) for _, name, url, _ in attachment_rows(tid, atts)])
+
+    def put(self, tender_id: str, attachments: list[dict], close_ts: int | None = None):
+        self.put_many([(tender_id, attachments, close_ts)])
+
+    def get(self, tender_id: str) -> list[tuple[str, str]] | None:
+        """
+        Документы тендера [(file_name, url)]: пустой список — документов нет,
+        None — список ещё не загружался (сообщение собрано из превью).
+        """
+        self._evict_old()
+        with self._lock:
+            item = self._items.get(tender_id)
+            if item is not None and item[0] > time.monotonic() - self.max_age:
+                self._items.move_to_end(tender_id)
+                self.hits += 1
+                return item[1]
+        with get_connection() as conn:
+            docs = conn.execute(
+                "SELECT file_name, url FROM attachments WHERE tender_id = ? ORDER BY id", (tender_id,)
+            ).fetchall()
+        self.db_hits += 1
+        if not docs:
+            # «документов нет» в таблице не хранится — такие списки помнит только LRU
+            return None
+        self._remember(tender_id, docs)
+        return docs
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "db_hits": self.db_hits}
+
+
+attachment_store = AttachmentStore()
@@ -0,0 +1,110 @@
+"""
+Микробенчмарк хелперов базы из tenderplan_bot: прежнее соединение на каждый вызов
+(sqlite3.connect, журнал отката, без pragma) против долгоживущих соединений
+database.get_connection() с WAL. Каждый режим идёт в отдельном процессе
+на своей временной базе.
+
+    python benchmarks/bench_db_helpers.py --users 200 --calls 5000
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_one(mode: str, users: int, calls: int) -> dict:
+    import sqlite3
+    import database
+    if mode == "legacy":
+        # прежний database.get_connection(): новое соединение на каждый вызов
+        database.get_connection = lambda: sqlite3.connect(database.DB_PATH)
+    from init_db import init_db
+    import tenderplan_bot as bot
+    if mode == "legacy":
+        bot.get_connection = database.get_connection
+    logging.disable(logging.CRITICAL)
+    init_db()
+
+    for u in range(users):
+        bot.add_user_key(u, f"key{u % 10}", f"Ключ {u % 10}")
+        bot.set_active_key(u, f"key{u % 10}")
+        bot.subscribe_user(u, f"key{u % 10}")
+
+    helpers = {
+        "get_active_key": lambda i: bot.get_active_key(i % users),
+        "is_subscribed": lambda i: bot.is_subscribed(i % users, f"key{i % 10}"),
+        "get_last_ts": lambda i: bot.get_last_ts(i % users, f"key{i % 10}"),
+        "was_tender_sent": lambda i: bot.was_tender_sent(i % users, f"t{i}"),
+        "mark_tender_as_sent": lambda i: bot.mark_tender_as_sent(i % users, f"t{i}"),
+        "update_subscription_state": lambda i: bot.update_subscription_state(i % users, f"key{i % 10}", i),
+    }
+    result = {"mode": mode, "us_per_call": {}}
+    for name, fn in helpers.items():
+        started = time.perf_counter()
+        for i in range(calls):
+            fn(i)
+        result["us_per_call"][name] = round((time.perf_counter() - started) / calls * 1e6, 1)
+
+    # читатели в потоках параллельно с писателем: как опрос подписок на фоне обработчиков
+    stop = threading.Event()
+    reads = [0]
+
+    def reader():
+        i = 0
+        while not stop.is_set():
+            bot.was_tender_sent(i % users, f"t{i}")
+            i += 1
+        reads[0] += i
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    started = time.perf_counter()
+    for i in range(calls):
+        bot.mark_tender_as_sent(i % users, f"m{i}")
+    write_time = time.perf_counter() - started
+    stop.set()
+    for t in threads:
+        t.join()
+    result["mixed_writes_per_s"] = round(calls / write_time)
+    result["mixed_reads_per_s"] = round(reads[0] / write_time)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--modes", nargs="+", default=["legacy", "pooled"])
+    parser.add_argument("--child", metavar="MODE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_one(args.child, args.users, args.calls)))
+        sys.exit(0)
+
+    results = []
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DB_PATH=os.path.join(tmp, "bench.sqlite3"))
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode,
+                 "--users", str(args.users), "--calls", str(args.calls)],
+                capture_output=True, text=True, check=True, env=env,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    names = list(results[0]["us_per_call"])
+    print(f"{'helper, мкс/вызов':<28}" + "".join(f"{r['mode']:>10}" for r in results))
+    for name in names:
+        print(f"{name:<28}" + "".join(f"{r['us_per_call'][name]:>10}" for r in results))
+    print(f"{'mixed: записей/с':<28}" + "".join(f"{r['mixed_writes_per_s']:>10}" for r in results))
+    print(f"{'mixed: чтений/с':<28}" + "".join(f"{r['mixed_reads_per_s']:>10}" for r in results))
@@ -0,0 +1,111 @@
+"""
+Латентность обработчиков бота под нагрузкой: N пользователей жмут кнопки
+(запрос /keys/getall, как в enter_key/refresh_keys_cb), пока часть из них
+выгружает тендеры сообщениями (export_messages) на локальном моке API.
+
+    python benchmarks/bench_handler_latency.py --users 50 --exporters 5
+    python benchmarks/bench_handler_latency.py --mode blocking   # поведение до async-клиента
+
+Режим blocking воспроизводит старую схему: синхронные HTTP-запросы прямо внутри
+корутин, из-за чего каждая выгрузка замораживает event loop.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_tenderplan import MockState, start_server  # noqa: E402
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def blocking_export(http, key_id: str):
+    """
+    Старый export_messages: синхронная пагинация и потоки для деталей.
+    """
+    page, previews = 0, []
+    while True:
+        batch = http.get("/tenders/v2/getlist", params={"id": key_id, "page": page, "size": 50}).json()["tenders"]
+        previews.extend(batch)
+        if len(batch) < 50:
+            break
+        page += 1
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        list(pool.map(lambda p: http.get("/tenders/get", params={"id": p["_id"]}).json(), previews))
+
+
+async def run(args, base_url: str):
+    import httpx
+    from messages_exporter import export_messages
+    from tenderplan_api import get_client, close_client
+
+    latencies: list[float] = []
+    blocking_http = httpx.Client(base_url=base_url) if args.mode == "blocking" else None
+
+    async def press(due: float):
+        # отсчёт от момента нажатия: в blocking-режиме сюда входит и ожидание занятого event loop
+        if blocking_http:
+            blocking_http.get("/keys/getall").json()
+        else:
+            await get_client().get_keys()
+        latencies.append(time.perf_counter() - due)
+
+    async def user(uid: int):
+        if uid < args.exporters:
+            key_id = f"key{uid % args.keys}"
+            if blocking_http:
+                blocking_export(blocking_http, key_id)
+            else:
+                await export_messages(key_id)
+            return
+        for _ in range(args.presses):
+            delay = random.uniform(0, args.think)
+            due = time.perf_counter() + delay
+            await asyncio.sleep(delay)
+            await press(due)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(uid) for uid in range(args.users)))
+    total = time.perf_counter() - started
+    await close_client()
+    if blocking_http:
+        blocking_http.close()
+
+    print(f"mode={args.mode} users={args.users} exporters={args.exporters} presses={len(latencies)}")
+    print(f"  p50 = {statistics.median(latencies) * 1000:8.1f} ms")
+    print(f"  p95 = {percentile(latencies, 95) * 1000:8.1f} ms")
+    print(f"  p99 = {percentile(latencies, 99) * 1000:8.1f} ms")
+    print(f"  max = {max(latencies) * 1000:8.1f} ms")
+    print(f"  wall = {total:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=("async", "blocking"), default="async")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--exporters", type=int, default=5)
+    parser.add_argument("--presses", type=int, default=10)
+    parser.add_argument("--think", type=float, default=0.5, help="пауза между нажатиями, с")
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--tenders", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка мока, с")
+    args = parser.parse_args()
+
+    server = start_server(MockState(args.keys, args.tenders, args.latency))
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/api"
+    # конфиг читается при импорте модулей бота, поэтому адрес выставляем до импорта
+    os.environ["TENDERPLAN_API_URL"] = base_url
+    # замеряем отзывчивость, а не квоту: лимитер мок не ограничивает
+    os.environ.setdefault("API_RATE_LIMIT", "1000000")
+    asyncio.run(run(args, base_url))
+    server.shutdown()
@@ -0,0 +1,193 @@
+"""
+Сквозной бенчмарк опроса подписок (check_new_tenders): N пользователей × M ключей
+на локальном моке Tenderplan API и поддельном боте, который запоминает отправки
+и с заданной вероятностью отвечает RetryAfter.
+
+Каждая точка замера — отдельный процесс с временной базой, заполненной заранее:
+пользователи, ключи, подписки и доля уже отправленных тендеров (sent_tenders).
+Первый цикл рассылает накопившиеся тендеры, второй показывает холостой цикл.
+
+    python benchmarks/bench_poller.py --users 10 100 1000 --keys 20 --subs 3 --tenders 50
+    python benchmarks/bench_poller.py --users 500 --retry-after 0.01 --tg-limits real
+
+По умолчанию лимиты Telegram сняты (--tg-limits none), чтобы мерить сам опрос;
+с --tg-limits real время цикла упирается в TG_CHAT_RATE / TG_GLOBAL_LIMIT.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DAY_MS = 24 * 3600 * 1000
+
+
+class FakeBot:
+    """
+    Вместо Bot API: запоминает отправленные сообщения, с вероятностью retry_after
+    бросает RetryAfter(1), каждый вызов занимает latency секунд.
+    """
+
+    def __init__(self, retry_after: float, latency: float, seed: int = 1):
+        self.retry_after = retry_after
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.sent = 0
+        self.retry_after_raised = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        from telegram.error import RetryAfter
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.retry_after and self.random.random() < self.retry_after:
+            self.retry_after_raised += 1
+            raise RetryAfter(1)
+        self.sent += 1
+        return None
+
+    send_document = send_message
+
+
+class FakeContext:
+    def __init__(self, bot: FakeBot):
+        self.bot = bot
+        self.job = None
+
+
+def seed_database(users: int, keys: int, subs: int, tenders: int, sent_ratio: float, seed: int = 1) -> dict:
+    """
+    Заполняет базу: у каждого пользователя subs случайных ключей из keys, last_ts = 0
+    (все тендеры мока новые), доля sent_ratio пар (пользователь, тендер) уже отправлена.
+    """
+    from database import get_connection
+    rnd = random.Random(seed)
+    close_ts = int(time.time() * 1000) + 7 * DAY_MS
+    user_keys, subscriptions, sent = [], [], []
+    for user_id in range(1, users + 1):
+        for k in rnd.sample(range(keys), min(subs, keys)):
+            key = f"key{k}"
+            user_keys.append((user_id, key, f"Ключ {k}"))
+            subscriptions.append((user_id, key))
+            sent.extend(
+                (user_id, f"{key}-t{i}", close_ts)
+                for i in range(tenders) if rnd.random() < sent_ratio
+            )
+    with get_connection() as conn:
+        conn.executemany("INSERT INTO user_keys (tg_user_id, tender_key, tender_name) VALUES (?, ?, ?)", user_keys)
+        conn.executemany("INSERT INTO subscriptions (tg_user_id, tender_key) VALUES (?, ?)", subscriptions)
+        conn.executemany(
+            "INSERT INTO subscription_state (tg_user_id, tender_key, last_ts) VALUES (?, ?, 0)", subscriptions
+        )
+        conn.executemany("INSERT INTO sent_tenders (tg_user_id, tender_id, close_ts) VALUES (?, ?, ?)", sent)
+    return {"subscriptions": len(subscriptions), "sent_before": len(sent)}
+
+
+def run_one(args) -> dict:
+    """
+    Один замер в дочернем процессе; адрес мока и база — в переменных окружения.
+    """
+    from init_db import init_db
+    init_db()
+    seeded = seed_database(args.users[0], args.keys, args.subs, args.tenders, args.sent_ratio)
+    import tenderplan_bot
+    from database import get_connection
+    from tenderplan_api import close_client
+    from telegram_dispatcher import outbound
+
+    queries = []
+    get_connection().set_trace_callback(queries.append)
+    bot = FakeBot(args.retry_after, args.send_latency)
+    ctx = FakeContext(bot)
+
+    async def main():
+        cycles = []
+        try:
+            for _ in range(args.cycles):
+                api_before = tenderplan_bot.api_limiter.calls
+                queries_before, sent_before, retry_before = len(queries), bot.sent, bot.retry_after_raised
+                started = time.perf_counter()
+                await tenderplan_bot.check_new_tenders(ctx)
+                elapsed = time.perf_counter() - started
+                cycles.append({
+                    "seconds": elapsed,
+                    "api_calls": tenderplan_bot.api_limiter.calls - api_before,
+                    "db_queries": len(queries) - queries_before,
+                    "sent": bot.sent - sent_before,
+                    "retry_after": bot.retry_after_raised - retry_before,
+                })
+        finally:
+            await outbound.shutdown()
+            await close_client()
+        return cycles
+
+    cycles = asyncio.run(main())
+    return {**seeded, "cycles": cycles}
+
+
+def spawn(users: int, args) -> dict:
+    from mock_tenderplan import MockState, start_server
+    state = MockState(args.keys, args.tenders, args.latency, args.throttle)
+    server = start_server(state)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            TENDERPLAN_API_URL=f"http://127.0.0.1:{server.server_address[1]}/api",
+            API_RATE_LIMIT=str(args.api_rate),
+            DB_PATH=os.path.join(tmp, "bench.sqlite3"),
+        )
+        if args.tg_limits == "none":
+            env.update(TG_GLOBAL_LIMIT="1000000", TG_GLOBAL_BURST="1000", TG_CHAT_RATE="1000000",
+                       TG_CHAT_BURST="1000", TG_GROUP_RATE="1000000")
+        argv = [sys.executable, __file__, "--child", "--users", str(users)]
+        for name in ("keys", "subs", "tenders", "sent_ratio", "retry_after", "send_latency", "cycles"):
+            argv += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+        try:
+            out = subprocess.run(argv, capture_output=True, text=True, check=True, env=env)
+        finally:
+            server.shutdown()
+            server.server_close()
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--keys", type=int, default=20, help="ключей в моке")
+    parser.add_argument("--subs", type=int, default=3, help="подписок на пользователя")
+    parser.add_argument("--tenders", type=int, default=50, help="новых тендеров на ключ")
+    parser.add_argument("--sent-ratio", type=float, default=0.2, help="доля уже отправленных пар")
+    parser.add_argument("--retry-after", type=float, default=0.0, help="вероятность RetryAfter на отправку")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="длительность вызова Bot API, с")
+    parser.add_argument("--latency", type=float, default=0.01, help="задержка ответа мока, с")
+    parser.add_argument("--throttle", type=float, default=0.0, help="доля ответов 429 от мока")
+    parser.add_argument("--api-rate", type=int, default=1_000_000,
+                        help="API_RATE_LIMIT за окно; боевое значение — 250")
+    parser.add_argument("--tg-limits", choices=["none", "real"], default="none")
+    parser.add_argument("--cycles", type=int, default=2)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # print из бота — в stderr, последней строкой stdout идёт результат
+        real_stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_one(args)
+        print(json.dumps(result), file=real_stdout)
+        sys.exit(0)
+
+    # SQL — выполненные statement'ы (executemany считается построчно)
+    print(f"{'users':>6} {'subs':>6} {'cycle':>5} {'time, s':>8} {'api':>6} {'SQL':>8} "
+          f"{'sent':>7} {'msg/s':>8} {'RetryAfter':>10}")
+    for users in args.users:
+        r = spawn(users, args)
+        for n, cycle in enumerate(r["cycles"], start=1):
+            rate = cycle["sent"] / cycle["seconds"] if cycle["seconds"] else 0.0
+            print(f"{users:>6} {r['subscriptions']:>6} {n:>5} {cycle['seconds']:>8.2f} {cycle['api_calls']:>6} "
+                  f"{cycle['db_queries']:>8} {cycle['sent']:>7} {rate:>8.0f} {cycle['retry_after']:>10}")
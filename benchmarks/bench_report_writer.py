@@ -0,0 +1,93 @@
+"""
+Сравнение записи Excel-отчёта: старая схема (load_workbook шаблона + ws['X{idx}'])
+против потокового ReportWriter в режиме write-only. Каждый замер идёт
+в отдельном процессе, чтобы пиковый RSS не смешивался между прогонами.
+
+    python benchmarks/bench_report_writer.py --rows 1000 10000 50000
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_details(rows: int) -> list[dict]:
+    from mock_tenderplan import synthetic_preview, synthetic_detail
+    now_ms = int(time.time() * 1000)
+    return [synthetic_detail(synthetic_preview(f"t{i}", i, now_ms), i, "key0") for i in range(rows)]
+
+
+def legacy_build(detailed: list[dict]) -> io.BytesIO:
+    """
+    Прежний способ: шаблон целиком в памяти, очистка строк и адресация ячеек строками.
+    """
+    import openpyxl
+    from config import TEMPLATE_PATH
+    from Parser import tender_row
+    wb = openpyxl.load_workbook(TEMPLATE_PATH)
+    ws = wb.active
+    for row in ws.iter_rows(min_row=3, max_row=ws.max_row):
+        for cell in row:
+            cell.value = None
+            cell.hyperlink = None
+    for idx, det in enumerate(detailed, start=3):
+        values, links, formats = tender_row(det)
+        for letter, value in values.items():
+            ws[f'{letter}{idx}'] = value
+        for letter, url in links.items():
+            if url:
+                ws[f'{letter}{idx}'].hyperlink = url
+        for letter, fmt in formats.items():
+            ws[f'{letter}{idx}'].number_format = fmt
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer
+
+
+def run_one(mode: str, rows: int) -> dict:
+    from Parser import build_workbook
+    detailed = make_details(rows)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    buffer = legacy_build(detailed) if mode == "legacy" else build_workbook(detailed)
+    elapsed = time.perf_counter() - started
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "peak_rss_mb": round(peak_rss / 1024, 1),
+        "rss_growth_mb": round((peak_rss - base_rss) / 1024, 1),
+        "size_kb": round(len(buffer.getvalue()) / 1024),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--modes", nargs="+", default=["legacy", "streaming"])
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_one(args.child[0], int(args.child[1]))))
+        sys.exit(0)
+
+    print(f"{'mode':<10} {'rows':>7} {'time, s':>8} {'peak RSS, MB':>13} {'RSS growth, MB':>15} {'xlsx, KB':>9}")
+    for rows in args.rows:
+        for mode in args.modes:
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode, str(rows)],
+                capture_output=True, text=True, check=True,
+            )
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{r['mode']:<10} {r['rows']:>7} {r['seconds']:>8} {r['peak_rss_mb']:>13} "
+                  f"{r['rss_growth_mb']:>15} {r['size_kb']:>9}")
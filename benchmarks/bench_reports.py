@@ -0,0 +1,130 @@
+"""
+Бенчмарк generate_report (Excel) и export_messages (сообщения) на локальном моке API.
+
+Для каждого объёма поднимается свой мок, каждый прогон идёт в отдельном процессе
+с чистой временной базой (холодные снимок и кэш деталей), чтобы пиковый RSS
+и кэши не смешивались между прогонами. Этапы берутся из PROFILE_LOG (см. profiling.py).
+
+    python benchmarks/bench_reports.py --tenders 100 1000 10000
+    python benchmarks/bench_reports.py --tenders 1000 --latency 0.05 --throttle 0.02 --modes report
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_one(mode: str) -> dict:
+    """
+    Один прогон в дочернем процессе; адрес мока и база — в переменных окружения.
+    """
+    from init_db import init_db
+    init_db()
+    from Parser import generate_report
+    from messages_exporter import export_messages
+    from tenderplan_api import close_client
+
+    async def main():
+        try:
+            if mode == "report":
+                report, _ = await generate_report("key0")
+                return len(report.getvalue())
+            return len(await export_messages("key0"))
+        finally:
+            await close_client()
+
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    error = None
+    try:
+        result = asyncio.run(main())
+    except Exception as e:
+        # например, 429 на пагинации — прогон считается, но помечается ошибкой
+        result, error = None, f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - started
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(os.environ["PROFILE_LOG"], encoding="utf-8") as f:
+        profile = json.loads(f.read().splitlines()[-1])
+    return {
+        "seconds": elapsed,
+        "result": result,
+        "error": error,
+        "peak_rss_mb": round(peak_rss / 1024, 1),
+        "rss_growth_mb": round((peak_rss - base_rss) / 1024, 1),
+        "stages": {s["stage"]: s["wall"] for s in profile["stages"]},
+    }
+
+
+def spawn(mode: str, tenders: int, args) -> dict:
+    from mock_tenderplan import MockState, start_server
+    state = MockState(1, tenders, args.latency, args.throttle, args.retry_after, args.attachments,
+                      errors=args.errors)
+    server = start_server(state)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            TENDERPLAN_API_URL=f"http://127.0.0.1:{server.server_address[1]}/api",
+            API_RATE_LIMIT=str(args.api_rate),
+            DB_PATH=os.path.join(tmp, "bench.sqlite3"),
+            PROFILE_LOG=os.path.join(tmp, "profile.jsonl"),
+        )
+        try:
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode],
+                capture_output=True, text=True, check=True, env=env,
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+    r = json.loads(out.stdout.strip().splitlines()[-1])
+    counts = state.snapshot()
+    r.update(
+        mode=mode,
+        tenders=tenders,
+        getlist=counts.get("/tenders/v2/getlist", 0),
+        get=counts.get("/tenders/get", 0),
+        throttled=counts.get("429", 0),
+    )
+    return r
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tenders", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--modes", nargs="+", default=["report", "messages"], choices=["report", "messages"])
+    parser.add_argument("--latency", type=float, default=0.01, help="задержка ответа мока, с")
+    parser.add_argument("--throttle", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--errors", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--attachments", type=int, default=3)
+    parser.add_argument("--api-rate", type=int, default=1_000_000,
+                        help="API_RATE_LIMIT за окно; боевое значение — 250")
+    parser.add_argument("--child", metavar="MODE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # вывод самих выгрузок (print) — в stderr, последней строкой stdout идёт результат
+        real_stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_one(args.child)
+        print(json.dumps(result), file=real_stdout)
+        sys.exit(0)
+
+    print(f"{'mode':<9} {'tenders':>7} {'time, s':>8} {'tenders/s':>9} {'getlist':>7} {'get':>6} "
+          f"{'429':>5} {'peak RSS, MB':>12}  stages, s")
+    for tenders in args.tenders:
+        for mode in args.modes:
+            r = spawn(mode, tenders, args)
+            stages = " ".join(f"{name}={seconds:.2f}" for name, seconds in r["stages"].items())
+            if r["error"]:
+                stages += f"  ОШИБКА {r['error'][:80]}"
+            print(f"{r['mode']:<9} {r['tenders']:>7} {r['seconds']:>8.2f} {r['tenders'] / r['seconds']:>9.0f} "
+                  f"{r['getlist']:>7} {r['get']:>6} {r['throttled']:>5} {r['peak_rss_mb']:>12}  {stages}")
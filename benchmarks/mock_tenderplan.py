@@ -0,0 +1,217 @@
+"""
+Локальный мок Tenderplan API для бенчмарков.
+
+Отдаёт /tenders/v2/getlist, /tenders/getlist, /tenders/get и /keys/getall
+на синтетических данных: детали с заказчиком, площадкой, вложенным JSON контактов
+(поле json) и вложениями. Задержка ответа, доли ответов 429 с Retry-After и 503 настраиваются.
+Запуск отдельным процессом:
+
+    python benchmarks/mock_tenderplan.py --port 8765 --tenders 500 --latency 0.05 --throttle 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DAY_MS = 24 * 3600 * 1000
+
+
+def synthetic_preview(tid: str, i: int, now_ms: int) -> dict:
+    """
+    Превью /tenders/v2/getlist: поля карточки тендера без вложений и заказчиков.
+    """
+    return {
+        "_id": tid,
+        "status": 1,
+        "number": f"0{i:018d}",
+        "orderName": f"Поставка товара №{i}",
+        "maxPrice": 100_000 + i,
+        "currency": "RUB",
+        "href": f"https://zakupki.gov.ru/{tid}",
+        "type": 1,
+        "placingWay": 15,
+        "publicationDateTime": now_ms - i * 60_000,
+        "submissionCloseDateTime": now_ms + 7 * DAY_MS,
+    }
+
+
+def synthetic_contacts(i: int) -> str:
+    """
+    Контакты заказчика во вложенном JSON, как в поле json у /tenders/get.
+    """
+    return json.dumps({
+        "2": {"fv": {
+            "0": {"fv": f"ГБУ «Учреждение №{i % 997}»"},
+            "1": {"fv": f"г. Москва, ул. Тестовая, д. {i % 300 + 1}"},
+            "2": {"fv": f"123{i % 1000:03d}, г. Москва, а/я {i % 50}"},
+            "3": {"fv": {
+                "0": {"fn": "FIO", "fv": f"Иванов Иван {i}"},
+                "1": {"fn": "Phone", "fv": f"+7-495-{i % 1000:03d}-00-00"},
+                "2": {"fn": "Email", "fv": f"zakupki{i}@example.ru"},
+            }},
+        }},
+    }, ensure_ascii=False)
+
+
+def synthetic_detail(preview: dict, i: int, key_id: str, attachments: int = 3) -> dict:
+    """
+    Детальная модель тендера в формате /tenders/get.
+    """
+    tid = preview["_id"]
+    return dict(
+        preview,
+        publicationDate=preview["publicationDateTime"],
+        key=key_id,
+        customers=[{"name": f"ГБУ «Учреждение №{i % 997}»"}],
+        platform={"name": "РТС-тендер", "href": "https://www.rts-tender.ru"},
+        okpd2=[{"code": f"{10 + i % 80}.{i % 10}{i % 7}.1"}],
+        region=77,
+        guaranteeApp=(100_000 + i) // 100,
+        guaranteeContract=(100_000 + i) // 20,
+        guaranteeProv=None,
+        summingUpDateTime=preview["submissionCloseDateTime"] + DAY_MS,
+        json=synthetic_contacts(i),
+        attachments=[
+            {"displayName": f"Документ {n + 1}.pdf", "href": f"https://zakupki.gov.ru/files/{tid}/{n}"}
+            for n in range((i % (attachments + 1)) if attachments else 0)
+        ],
+    )
+
+
+class MockState:
+    """
+    Синтетические тендеры и счётчики запросов по эндпоинтам.
+    """
+
+    def __init__(self, keys: int = 3, tenders_per_key: int = 500, latency: float = 0.05,
+                 throttle: float = 0.0, retry_after: int = 1, attachments: int = 3, seed: int = 1,
+                 errors: float = 0.0):
+        self.latency = latency
+        # доля ответов 503; down = True — API «лежит» и отвечает 503 на всё
+        self.errors = errors
+        self.down = False
+        # доля запросов, на которые отвечаем 429 Too Many Requests с Retry-After
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        now_ms = int(time.time() * 1000)
+        self.keys = [{"_id": f"key{k}", "name": f"Ключ {k}"} for k in range(keys)]
+        self.tenders: dict[str, list[dict]] = {}
+        self.details: dict[str, dict] = {}
+        for key in self.keys:
+            previews = []
+            for i in range(tenders_per_key):
+                preview = synthetic_preview(f"{key['_id']}-t{i}", i, now_ms)
+                previews.append(preview)
+                self.details[preview["_id"]] = synthetic_detail(preview, i, key["_id"], attachments)
+            self.tenders[key["_id"]] = previews
+        self.counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, path: str):
+        with self._lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+
+    def throttled(self) -> bool:
+        if not self.throttle:
+            return False
+        with self._lock:
+            hit = self._random.random() < self.throttle
+            if hit:
+                self.counts["429"] = self.counts.get("429", 0) + 1
+        return hit
+
+    def failed(self) -> bool:
+        if not self.down and not self.errors:
+            return False
+        with self._lock:
+            hit = self.down or self._random.random() < self.errors
+            if hit:
+                self.counts["503"] = self.counts.get("503", 0) + 1
+        return hit
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, payload, headers: dict | None = None):
+            body = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = parse_qs(url.query)
+            path = url.path.removeprefix("/api")
+            state.count(path)
+            if state.latency:
+                time.sleep(state.latency)
+            if state.failed():
+                return self._send(503, {"error": "service unavailable"})
+            if state.throttled():
+                return self._send(429, {"error": "too many requests"},
+                                  {"Retry-After": str(state.retry_after)})
+
+            if path in ("/tenders/v2/getlist", "/tenders/getlist"):
+                key_id = (q.get("id") or q.get("key") or [""])[0]
+                page = int(q.get("page", ["0"])[0])
+                size = int(q.get("size", ["50"])[0])
+                from_ts = int(q.get("fromPublicationDateTime", ["0"])[0])
+                items = [t for t in state.tenders.get(key_id, []) if t["publicationDateTime"] >= from_ts]
+                return self._send(200, {"tenders": items[page * size:(page + 1) * size]})
+            if path == "/tenders/get":
+                tid = q.get("id", [""])[0]
+                detail = state.details.get(tid)
+                return self._send(200, detail) if detail else self._send(404, {"error": "not found"})
+            if path == "/keys/getall":
+                return self._send(200, state.keys)
+            return self._send(404, {"error": "unknown endpoint"})
+
+    return Handler
+
+
+def start_server(state: MockState, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Поднимает сервер в фоновом потоке и возвращает его; адрес — server.server_address.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--tenders", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--throttle", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--errors", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--attachments", type=int, default=3, help="максимум вложений у тендера")
+    args = parser.parse_args()
+    state = MockState(args.keys, args.tenders, args.latency,
+                      args.throttle, args.retry_after, args.attachments, errors=args.errors)
+    srv = start_server(state, port=args.port)
+    print(f"Mock Tenderplan API: http://127.0.0.1:{args.port}/api")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from config import (
+    DETAIL_CONCURRENCY_START, DETAIL_CONCURRENCY_MIN, DETAIL_CONCURRENCY_MAX,
+    DETAIL_LATENCY_SPIKE, DETAIL_DECREASE_FACTOR,
+)
+from metrics import DETAIL_CONCURRENCY, DETAIL_CONCURRENCY_CUTS
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveConcurrency:
+    """
+    Адаптивный предел одновременных запросов (AIMD), общий для всех корутин процесса.
+
+    - пока ответы здоровые, предел растёт аддитивно: +1 за каждые limit успешных ответов;
+    - на 429 или всплеск задержки (ответ дольше spike × средняя задержка) предел
+      умножается на decrease, но не ниже min_limit;
+    - сигналы от запросов, начатых до последнего снижения, не снижают предел повторно —
+      одна «волна» 429 даёт одно снижение, а не лавину.
+
+    Задержка считается вместе с ожиданием лимитера квоты: если очередь к квоте растёт,
+    больше параллельности не нужно, и предел сам останавливается у квоты.
+    Темп запросов по-прежнему держит api_limiter, здесь — только число запросов в полёте.
+
+    Очередь ожидающих и занятые места свои у каждого event loop (фьючерс одного цикла
+    нельзя разбудить из другого), предел и средняя задержка — общие.
+    """
+
+    # вес нового замера в средней задержке
+    EWMA_WEIGHT = 0.1
+    # всплеск должен быть длиннее средней хотя бы на столько секунд — от шума при быстрых ответах
+    SPIKE_MIN_EXCESS = 0.05
+
+    def __init__(self, name: str, start: int, min_limit: int, max_limit: int,
+                 spike: float = DETAIL_LATENCY_SPIKE, decrease: float = DETAIL_DECREASE_FACTOR):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.spike = spike
+        self.decrease = decrease
+        self.limit = float(max(min_limit, min(start, max_limit)))
+        self.avg_latency: float | None = None
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopSlots]" = weakref.WeakKeyDictionary()
+        self._decreased_at = 0.0
+        # статистика
+        self.successes = 0
+        self.throttled = 0
+        self.spikes = 0
+        self.cuts = 0
+        self.peak_limit = self.limit
+        DETAIL_CONCURRENCY.set(int(self.limit), name)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(slots.in_flight for slots in list(self._slots.values()))
+
+    def _slots_for_loop(self) -> "_LoopSlots":
+        # как и клиент API (см. tenderplan_api.get_client), места привязаны к event loop'у
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = _LoopSlots()
+        return slots
+
+    def _wake(self, slots: "_LoopSlots"):
+        """
+        Будит ожидающих цикла по порядку, пока есть свободные места под текущий предел.
+        """
+        while slots.waiters and slots.in_flight < int(self.limit):
+            waiter = slots.waiters.popleft()
+            if not waiter.done():
+                slots.in_flight += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Занимает место под один запрос. Исход запроса (успех, 429, задержка)
+        определяется по выходу из блока и подстраивает предел.
+        """
+        slots = self._slots_for_loop()
+        if not slots.waiters and slots.in_flight < int(self.limit):
+            slots.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            slots.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # место уже выдано — возвращаем его следующему
+                    slots.in_flight -= 1
+                    self._wake(slots)
+                raise
+        started = time.monotonic()
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            response = getattr(e, "response", None)
+            throttled = response is not None and response.status_code == 429
+            raise
+        finally:
+            self._record(started, time.monotonic() - started, throttled)
+            slots.in_flight -= 1
+            self._wake(slots)
+
+    def _record(self, started: float, latency: float, throttled: bool):
+        if throttled:
+            self.throttled += 1
+            self._cut(started, "429")
+            return
+        if self.avg_latency is not None and latency > max(self.spike * self.avg_latency,
+                                                          self.avg_latency + self.SPIKE_MIN_EXCESS):
+            self.spikes += 1
+            self._cut(started, f"задержка {latency:.2f} с при средней {self.avg_latency:.2f} с")
+            # всплеск не сдвигает среднюю: иначе после затяжного всплеска он станет нормой
+            return
+        self.avg_latency = latency if self.avg_latency is None else (
+            self.avg_latency + self.EWMA_WEIGHT * (latency - self.avg_latency)
+        )
+        self.successes += 1
+        if self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+            DETAIL_CONCURRENCY.set(int(self.limit), self.name)
+
+    def _cut(self, started: float, reason: str):
+        if started < self._decreased_at:
+            return
+        old = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self._decreased_at = time.monotonic()
+        self.cuts += 1
+        DETAIL_CONCURRENCY.set(int(self.limit), self.name)
+        DETAIL_CONCURRENCY_CUTS.inc(self.name)
+        logger.info(f"{self.name}: {reason}, параллельность {old} → {int(self.limit)}")
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "peak_limit": int(self.peak_limit),
+            "in_flight": self.in_flight,
+            "avg_latency": round(self.avg_latency or 0.0, 3),
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "spikes": self.spikes,
+            "cuts": self.cuts,
+        }
+
+
+class _LoopSlots:
+    """
+    Места AdaptiveConcurrency в одном event loop: ожидающие и запросы в полёте.
+    """
+
+    def __init__(self):
+        self.waiters: deque[asyncio.Future] = deque()
+        self.in_flight = 0
+
+
+# Общий предел для /tenders/get: отчёты, выгрузка сообщениями и опрос подписок
+# делят одну квоту API, поэтому и параллельность подстраивается одна на всех.
+detail_concurrency = AdaptiveConcurrency(
+    "tenders_get",
+    start=DETAIL_CONCURRENCY_START,
+    min_limit=DETAIL_CONCURRENCY_MIN,
+    max_limit=DETAIL_CONCURRENCY_MAX,
+)
@@ -10,3 +10,129 @@ TOKEN = os.getenv("TOKEN")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_PATH = os.path.join(BASE_DIR, "форма.xlsx")
+
+# ─── База данных ──────────────────────────────────────────────────────
+DB_PATH = os.getenv("DB_PATH", os.path.join(BASE_DIR, "bot_database.sqlite3"))
+# размер страничного кэша SQLite на соединение, КБ
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+# сколько секунд ждать снятия блокировки записи
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+# сколько дней после окончания приёма заявок хранить sent_tenders и вложения тендера
+SENT_RETENTION_DAYS = int(os.getenv("SENT_RETENTION_DAYS", "7"))
+# срок хранения старых записей, у которых дата окончания неизвестна, дни
+SENT_LEGACY_TTL_DAYS = int(os.getenv("SENT_LEGACY_TTL_DAYS", "30"))
+# час (UTC) ежедневной чистки и сжатия базы
+DB_MAINTENANCE_HOUR = int(os.getenv("DB_MAINTENANCE_HOUR", "4"))
+# VACUUM, только если свободных страниц больше этой доли файла
+DB_VACUUM_FREE_RATIO = float(os.getenv("DB_VACUUM_FREE_RATIO", "0.2"))
+# фильтр Блума перед sent_tenders: доля ложных срабатываний и минимальная ёмкость
+SENT_FILTER_ERROR_RATE = float(os.getenv("SENT_FILTER_ERROR_RATE", "0.01"))
+SENT_FILTER_MIN_CAPACITY = int(os.getenv("SENT_FILTER_MIN_CAPACITY", "100000"))
+
+# ─── Tenderplan API ───────────────────────────────────────────────────
+API_BASE_URL = os.getenv("TENDERPLAN_API_URL", "https://tenderplan.ru/api")
+API_VERIFY_SSL = os.getenv("API_VERIFY_SSL", "0") == "1"
+# таймауты HTTP-клиента, секунды
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "10"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "30"))
+# пул keep-alive соединений
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))
+API_MAX_KEEPALIVE = int(os.getenv("API_MAX_KEEPALIVE", "10"))
+# квота API: не больше API_RATE_LIMIT запросов за API_RATE_WINDOW секунд
+API_RATE_LIMIT = int(os.getenv("API_RATE_LIMIT", "250"))
+API_RATE_WINDOW = float(os.getenv("API_RATE_WINDOW", "10"))
+API_RATE_BURST = int(os.getenv("API_RATE_BURST", "25"))
+# повторы запросов (429, 5xx, сетевые ошибки): сколько раз и экспоненциальная пауза, с
+API_RETRIES = int(os.getenv("API_RETRIES", "4"))
+API_BACKOFF_BASE = float(os.getenv("API_BACKOFF_BASE", "0.5"))
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX", "30"))
+# Retry-After от сервера соблюдается, но ждём не дольше стольких секунд
+API_RETRY_AFTER_MAX = float(os.getenv("API_RETRY_AFTER_MAX", "60"))
+# предохранитель эндпоинта: размыкается после стольких сбоев подряд и на столько секунд
+API_BREAKER_THRESHOLD = int(os.getenv("API_BREAKER_THRESHOLD", "5"))
+API_BREAKER_RESET = float(os.getenv("API_BREAKER_RESET", "30"))
+
+# ─── Параллельность запросов деталей (/tenders/get) ──────────────────
+# адаптивный предел (AIMD, см. concurrency.py): стартовое значение и границы
+DETAIL_CONCURRENCY_START = int(os.getenv("DETAIL_CONCURRENCY_START", "5"))
+DETAIL_CONCURRENCY_MIN = int(os.getenv("DETAIL_CONCURRENCY_MIN", "2"))
+DETAIL_CONCURRENCY_MAX = int(os.getenv("DETAIL_CONCURRENCY_MAX", "32"))
+# во сколько раз ответ дольше средней задержки считается всплеском
+DETAIL_LATENCY_SPIKE = float(os.getenv("DETAIL_LATENCY_SPIKE", "3"))
+# множитель предела после 429 или всплеска
+DETAIL_DECREASE_FACTOR = float(os.getenv("DETAIL_DECREASE_FACTOR", "0.5"))
+
+# ─── Постраничная загрузка превью (getlist) ───────────────────────────
+# начальный размер страницы; при полных страницах удваивается до LIST_PAGE_SIZE_MAX
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "100"))
+LIST_PAGE_SIZE_MAX = int(os.getenv("LIST_PAGE_SIZE_MAX", "500"))
+# меньше этого размер не уменьшается, даже если API отвергает большие страницы
+LIST_PAGE_SIZE_MIN = int(os.getenv("LIST_PAGE_SIZE_MIN", "25"))
+# сколько страниц одного ключа запрашивается одновременно
+LIST_CONCURRENCY = int(os.getenv("LIST_CONCURRENCY", "4"))
+
+# ─── Опрос подписок ───────────────────────────────────────────────────
+# период job'а check_new_tenders, секунды
+POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "1800"))
+# сколько ключей опрашивается одновременно
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", "5"))
+
+# ─── Кэш деталей тендеров ─────────────────────────────────────────────
+DETAIL_CACHE_SIZE = int(os.getenv("DETAIL_CACHE_SIZE", "5000"))
+# срок жизни записи, секунды
+DETAIL_CACHE_TTL = float(os.getenv("DETAIL_CACHE_TTL", "900"))
+# хранить кэш и в SQLite, чтобы он переживал перезапуск
+DETAIL_CACHE_PERSIST = os.getenv("DETAIL_CACHE_PERSIST", "0") == "1"
+
+# ─── Документы тендеров (кнопки «📎 Документы») ────────────────────────
+# сколько списков документов держать в памяти и сколько секунд
+ATTACHMENT_CACHE_SIZE = int(os.getenv("ATTACHMENT_CACHE_SIZE", "2000"))
+ATTACHMENT_CACHE_TTL = float(os.getenv("ATTACHMENT_CACHE_TTL", "3600"))
+
+# ─── Выгрузка сообщениями ─────────────────────────────────────────────
+# сколько готовых сообщений (и превью перед ними) ждёт своей очереди; дальше загрузка приостанавливается
+MESSAGE_STREAM_BUFFER = int(os.getenv("MESSAGE_STREAM_BUFFER", "50"))
+# сколько задач собирают сообщения; запросы к API всё равно ограничены общим адаптивным пределом
+MESSAGE_STREAM_WORKERS = int(os.getenv("MESSAGE_STREAM_WORKERS", "32"))
+
+# ─── Отчёты ───────────────────────────────────────────────────────────
+# сколько отчётов строится одновременно
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# где собирается книга: process — пул процессов, thread — пул потоков
+REPORT_POOL = os.getenv("REPORT_POOL", "process")
+# сколько секунд готовый отчёт отдаётся повторным запросам по тому же ключу
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "300"))
+
+# ─── Отправка в Telegram ──────────────────────────────────────────────
+# общий лимит бота, сообщений в секунду (Telegram: около 30), из них на «всплеск»
+TG_GLOBAL_LIMIT = float(os.getenv("TG_GLOBAL_LIMIT", "30"))
+TG_GLOBAL_BURST = int(os.getenv("TG_GLOBAL_BURST", "5"))
+# лимит на один личный чат: около одного сообщения в секунду, короткие всплески допустимы
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_CHAT_BURST = int(os.getenv("TG_CHAT_BURST", "5"))
+# лимит на группу: 20 сообщений в минуту
+TG_GROUP_RATE = float(os.getenv("TG_GROUP_RATE", str(20 / 60)))
+# сколько запросов к Bot API может быть в полёте одновременно
+TG_SEND_CONCURRENCY = int(os.getenv("TG_SEND_CONCURRENCY", "30"))
+# сколько раз повторять сообщение после RetryAfter и сетевых ошибок
+TG_SEND_RETRIES = int(os.getenv("TG_SEND_RETRIES", "5"))
+
+# ─── Метрики ──────────────────────────────────────────────────────────
+# порт HTTP-эндпоинта /metrics в формате Prometheus; 0 — выключен
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# по умолчанию доступен только локально
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# ─── Профилирование ───────────────────────────────────────────────────
+# JSONL-журнал этапов отчётов и выгрузок (время, запросы к API, пик памяти); пусто — выключен
+PROFILE_LOG = os.getenv("PROFILE_LOG", "")
+# куда складывать дампы cProfile, заказанные командой /profile
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+# Telegram id администраторов через запятую — им доступна /profile
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+
+# ─── Дайджесты подписок ───────────────────────────────────────────────
+# час (UTC) ежедневного дайджеста по умолчанию
+DIGEST_DEFAULT_HOUR = int(os.getenv("DIGEST_DEFAULT_HOUR", "6"))
+# больше стольких тендеров — дайджест уходит Excel-файлом, а не текстом
+DIGEST_TEXT_LIMIT = int(os.getenv("DIGEST_TEXT_LIMIT", "30"))
@@ -1,7 +1,117 @@
-import sqlite3
 import os
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "bot_database.sqlite3")
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from config import DB_PATH, DB_CACHE_SIZE_KB, DB_BUSY_TIMEOUT, METRICS_PORT
+from metrics import DB_QUERY_SECONDS
+
+# сколько подготовленных запросов держит каждое соединение
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_lock = threading.Lock()
+# меняется в close_connections(): потоки заметят это и переоткроют соединение
+_generation = 0
+
+
+# ─── Замер запросов для метрик ────────────────────────────────────────
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)", re.IGNORECASE)
+
+
+# текстов запросов в коде немного — разбор кэшируется
+@lru_cache(maxsize=512)
+def _statement_labels(sql: str) -> tuple[str, str]:
+    """
+    Метки запроса для sqlite_query_seconds: команда и первая таблица.
+    """
+    words = sql.split(None, 1)
+    table = _TABLE_RE.search(sql)
+    return (words[0].upper() if words else ""), (table.group(1).lower() if table else "")
+
+
+class _TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, *_statement_labels(sql))
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, *_statement_labels(sql))
+
+
+class _TimedConnection(sqlite3.Connection):
+    """
+    Соединение, которое пишет время каждого execute/executemany в метрики.
+    sqlite3.Connection.execute не проходит через cursor(), поэтому переопределены оба.
+    """
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        # соединение живёт в своём потоке, check_same_thread снят только для close_connections()
+        check_same_thread=False,
+        # замер запросов — только когда метрики кто-то читает
+        factory=_TimedConnection if METRICS_PORT else sqlite3.Connection,
+    )
+    # WAL: читатели не ждут писателя; synchronous=NORMAL в WAL безопасен при сбое процесса
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Долгоживущее соединение текущего потока.
+
+    Соединение открывается один раз на поток (и заново после fork) и
+    переиспользуется всеми хелперами. `with get_connection() as conn:` по-прежнему
+    коммитит или откатывает транзакцию, но соединение не закрывает.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid() or _local.generation != _generation:
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.generation = _generation
+        with _lock:
+            _connections.append(conn)
+    return conn
+
 
-def get_connection():
-    return sqlite3.connect(DB_PATH)
\ No newline at end of file
+def close_connections():
+    """
+    Закрывает все открытые соединения (при остановке бота).
+    """
+    global _generation
+    with _lock:
+        conns = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
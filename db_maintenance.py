@@ -0,0 +1,78 @@
+import logging
+import os
+import time
+from config import DB_PATH, SENT_RETENTION_DAYS, DB_VACUUM_FREE_RATIO
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 24 * 3600 * 1000
+
+
+def purge_stale_rows(now_ms: int | None = None) -> dict[str, int]:
+    """
+    Удаляет записи по тендерам, приём заявок по которым закончился больше
+    SENT_RETENTION_DAYS дней назад: такие тендеры уже не придут в опросе подписок
+    и не попадут в отчёт. Возвращает число удалённых строк по таблицам.
+    """
+    now_ms = now_ms or int(time.time() * 1000)
+    border = now_ms - SENT_RETENTION_DAYS * DAY_MS
+    removed = {}
+    with get_connection() as conn:
+        for table in ("sent_tenders", "attachments"):
+            cur = conn.execute(f"DELETE FROM {table} WHERE close_ts IS NOT NULL AND close_ts < ?", (border,))
+            removed[table] = cur.rowcount
+        cur = conn.execute("DELETE FROM report_snapshots WHERE close_ts > 0 AND close_ts < ?", (now_ms,))
+        removed["report_snapshots"] = cur.rowcount
+        # в дайджест не отправляем тендеры, приём заявок по которым уже закончился
+        cur = conn.execute("DELETE FROM digest_queue WHERE close_ts IS NOT NULL AND close_ts < ?", (now_ms,))
+        removed["digest_queue"] = cur.rowcount
+        cur = conn.execute("DELETE FROM tender_cache WHERE expires_at <= ?", (now_ms / 1000,))
+        removed["tender_cache"] = cur.rowcount
+    return removed
+
+
+def compact_database() -> dict:
+    """
+    Сбрасывает WAL в основной файл, при большой доле свободных страниц делает VACUUM
+    и обновляет статистику планировщика. Возвращает размеры файла до и после.
+    """
+    size_before = _db_size()
+    conn = get_connection()
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    vacuumed = False
+    if page_count and freelist / page_count >= DB_VACUUM_FREE_RATIO:
+        conn.execute("VACUUM")
+        vacuumed = True
+    conn.execute("PRAGMA optimize")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {
+        "size_before": size_before,
+        "size_after": _db_size(),
+        "free_pages": freelist,
+        "vacuumed": vacuumed,
+    }
+
+
+def _db_size() -> int:
+    return sum(
+        os.path.getsize(path)
+        for path in (DB_PATH, DB_PATH + "-wal")
+        if os.path.exists(path)
+    )
+
+
+def run_maintenance() -> dict:
+    """
+    Чистка устаревших строк и сжатие базы. Блокирующая: из бота вызывается в отдельном потоке.
+    """
+    started = time.monotonic()
+    removed = purge_stale_rows()
+    compacted = compact_database()
+    logger.info(
+        f"Обслуживание базы за {time.monotonic() - started:.1f} с: удалено {removed}, "
+        f"размер {compacted['size_before'] // 1024} → {compacted['size_after'] // 1024} КБ, "
+        f"VACUUM: {'да' if compacted['vacuumed'] else 'нет'}"
+    )
+    return {"removed": removed, **compacted}
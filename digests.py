@@ -0,0 +1,109 @@
+import json
+import zlib
+from database import get_connection
+
+# ─── Режимы доставки подписки ─────────────────────────────────────────
+INSTANT = "instant"
+HOURLY = "hourly"
+DAILY = "daily"
+
+MODE_LABELS = {
+    INSTANT: "сразу",
+    HOURLY: "раз в час",
+    DAILY: "раз в день",
+}
+
+
+def set_delivery_mode(user_id: int, key: str, mode: str, hour: int | None = None):
+    """
+    Меняет режим доставки подписки; hour — час (UTC) ежедневного дайджеста.
+    """
+    with get_connection() as conn:
+        if hour is None:
+            conn.execute(
+                "UPDATE subscriptions SET delivery_mode = ? WHERE tg_user_id = ? AND tender_key = ?",
+                (mode, user_id, key)
+            )
+        else:
+            conn.execute(
+                "UPDATE subscriptions SET delivery_mode = ?, digest_hour = ? "
+                "WHERE tg_user_id = ? AND tender_key = ?",
+                (mode, hour, user_id, key)
+            )
+
+
+def set_digest_hour(user_id: int, hour: int) -> int:
+    """
+    Задаёт час (UTC) ежедневного дайджеста всем подпискам пользователя. Возвращает число подписок.
+    """
+    with get_connection() as conn:
+        cur = conn.execute("UPDATE subscriptions SET digest_hour = ? WHERE tg_user_id = ?", (hour, user_id))
+        return cur.rowcount
+
+
+def get_delivery_modes(user_id: int) -> list[tuple[str, str, str, int]]:
+    """
+    Подписки пользователя: [(tender_key, имя ключа, режим, час дайджеста)].
+    """
+    with get_connection() as conn:
+        return conn.execute(
+            """
+            SELECT s.tender_key, COALESCE(k.tender_name, ''), s.delivery_mode, s.digest_hour
+            FROM subscriptions s
+            LEFT JOIN user_keys k ON k.tg_user_id = s.tg_user_id AND k.tender_key = s.tender_key
+            WHERE s.tg_user_id = ?
+            """,
+            (user_id,)
+        ).fetchall()
+
+
+def digest_row(user_id: int, key: str, detail: dict,
+                publication_ts: int, close_ts: int | None) -> tuple:
+    """
+    Строка digest_queue для executemany; деталь хранится сжатым JSON.
+    """
+    blob = zlib.compress(json.dumps(detail, ensure_ascii=False).encode("utf-8"))
+    return user_id, key, detail.get("_id", ""), publication_ts, close_ts, blob
+
+
+def due_digests(hour: int) -> list[tuple[int, str, str]]:
+    """
+    Подписки, дайджест которых пора отправить в этот час (UTC) и в очереди которых что-то есть:
+    [(tg_user_id, tender_key, имя ключа)]. Подписки, переключённые на мгновенную доставку,
+    попадают сюда, пока в их очереди остались тендеры: иначе те никогда не будут отправлены.
+    """
+    with get_connection() as conn:
+        return conn.execute(
+            """
+            SELECT DISTINCT s.tg_user_id, s.tender_key, COALESCE(NULLIF(k.tender_name, ''), s.tender_key)
+            FROM subscriptions s
+            JOIN digest_queue q ON q.tg_user_id = s.tg_user_id AND q.tender_key = s.tender_key
+            LEFT JOIN user_keys k ON k.tg_user_id = s.tg_user_id AND k.tender_key = s.tender_key
+            WHERE s.delivery_mode IN (?, ?) OR (s.delivery_mode = ? AND s.digest_hour = ?)
+            """,
+            (HOURLY, INSTANT, DAILY, hour)
+        ).fetchall()
+
+
+def load_digest(user_id: int, key: str) -> list[dict]:
+    """
+    Накопленные для дайджеста детали тендеров, по дате публикации.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT detail FROM digest_queue WHERE tg_user_id = ? AND tender_key = ? "
+            "ORDER BY publication_ts",
+            (user_id, key)
+        ).fetchall()
+    return [json.loads(zlib.decompress(blob)) for blob, in rows]
+
+
+def clear_digest(user_id: int, key: str, tender_ids: list[str]):
+    """
+    Убирает из очереди отправленные в дайджесте тендеры.
+    """
+    with get_connection() as conn:
+        conn.executemany(
+            "DELETE FROM digest_queue WHERE tg_user_id = ? AND tender_key = ? AND tender_id = ?",
+            [(user_id, key, tid) for tid in tender_ids]
+        )
@@ -1,3 +1,5 @@
+import time
+from config import SENT_LEGACY_TTL_DAYS, DIGEST_DEFAULT_HOUR
 from database import get_connection
 
 def init_db():
@@ -64,6 +66,59 @@ def init_db():
                 UNIQUE(tender_id, url)
             )
         """)
+        # Кэш детальных моделей тендеров (второй уровень TenderCache)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tender_cache (
+                tender_id  TEXT PRIMARY KEY,
+                payload    TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        # Снимок последнего Excel-отчёта по ключу для инкрементальной выгрузки
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS report_snapshots (
+                key_id      TEXT    NOT NULL,
+                tender_id   TEXT    NOT NULL,
+                status      INTEGER NOT NULL DEFAULT 0,
+                close_ts    INTEGER NOT NULL DEFAULT 0,
+                fingerprint TEXT    NOT NULL,
+                detail      BLOB    NOT NULL,
+                updated_at  INTEGER NOT NULL,
+                PRIMARY KEY (key_id, tender_id)
+            )
+        """)
+
+        # Срок хранения sent_tenders и attachments: close_ts — окончание приёма заявок (мс).
+        # Старым записям без даты даём SENT_LEGACY_TTL_DAYS от момента миграции.
+        legacy_close_ts = int((time.time() + SENT_LEGACY_TTL_DAYS * 86400) * 1000)
+        for table in ("sent_tenders", "attachments"):
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [row[1] for row in cursor.fetchall()]
+            if "close_ts" not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN close_ts INTEGER")
+                cursor.execute(f"UPDATE {table} SET close_ts = ? WHERE close_ts IS NULL", (legacy_close_ts,))
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_close_ts ON {table} (close_ts)")
+
+        # Режим доставки подписки: instant — каждый тендер сразу, hourly / daily — дайджестом
+        cursor.execute("PRAGMA table_info(subscriptions)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if "delivery_mode" not in columns:
+            cursor.execute("ALTER TABLE subscriptions ADD COLUMN delivery_mode TEXT NOT NULL DEFAULT 'instant'")
+        if "digest_hour" not in columns:
+            cursor.execute(f"ALTER TABLE subscriptions ADD COLUMN digest_hour INTEGER NOT NULL DEFAULT {DIGEST_DEFAULT_HOUR}")
+
+        # Тендеры, накопленные для дайджеста до его отправки
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS digest_queue (
+                tg_user_id     INTEGER NOT NULL,
+                tender_key     TEXT    NOT NULL,
+                tender_id      TEXT    NOT NULL,
+                publication_ts INTEGER NOT NULL DEFAULT 0,
+                close_ts       INTEGER,
+                detail         BLOB    NOT NULL,
+                PRIMARY KEY (tg_user_id, tender_key, tender_id)
+            )
+        """)
         conn.commit()
 
 if __name__ == "__main__":
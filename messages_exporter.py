@@ -1,19 +1,26 @@
-import requests
-import time
+import asyncio
 import logging
+import httpx
+from contextlib import aclosing
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from config import TOKEN
-# Основные константы и сессия
-BASE_URL = 'https://tenderplan.ru/api'
-HEADERS = {
-    'Authorization': f'Bearer {TOKEN}',
-    'Accept': 'application/json',
-    'Content-Type': 'application/json',
-}
+from typing import AsyncIterator
+from config import MESSAGE_STREAM_BUFFER, MESSAGE_STREAM_WORKERS
+from tenderplan_api import get_client
+from pagination import iter_previews
+from tender_cache import detail_cache
+from concurrency import detail_concurrency
+from resilience import CircuitOpenError
+from profiling import start_run
+
+# ограничение Telegram на длину текста сообщения
+TELEGRAM_TEXT_LIMIT = 4096
+# разделитель тендеров в компактном сообщении
+PACK_SEPARATOR = "\n\n"
+# поля, без которых format_tender_message не соберёт полный текст;
+# если все они есть в превью, деталь за сообщением не запрашивается
+MESSAGE_FIELDS = ("number", "orderName", "maxPrice", "currency", "href", "type", "placingWay")
+CLOSE_FIELDS = ("submissionCloseDateTime", "submissionCloseDate")
 
-session = requests.Session()
-session.headers.update(HEADERS)
 # ─── Справочник статусов внутри кода ───────────────────────────────────
 STATUS_LOOKUP = {
     1: "Прием заявок",
@@ -42,87 +49,94 @@ PLACINGWAY_LOOKUP = {
 }
 
 
-def fetch_all_tenders(key_id: str) -> str:
-    """
-    Загружает все превью тендеров по ключу, выполняя постраничный запрос.
-    """
-    all_tenders = []
-    page = 0
-    size = 50  # сколько тендеров за 1 запрос
-    while True:
-        resp = session.get(
-           f"{BASE_URL}/tenders/v2/getlist",
-           params={
-            'type': 0,
-            'id': key_id,
-            'statuses': [1],
-            'page': page,
-            'size': size
-        },
-            verify=False
-        )
-        resp.raise_for_status()
-        raw_batch = resp.json().get('tenders', [])
-        # вручную фильтруем, чтобы точно остались только "Подача заявок"
-        now_ts = int(datetime.now().timestamp() * 1000)
-        batch = [
-            t for t in raw_batch
-            if t.get("status") == 1 and
-               (t.get("submissionCloseDateTime") or t.get("submissionCloseDate") or 0) > now_ts
-        ]
-        if not batch:
-            break
-        all_tenders.extend(batch)
-        page += 1
-        # если пришло меньше, чем запрошено — значит это последняя страница
-        if len(raw_batch) < size:
-            break
-
-    print(f"Всего тендеров после пагинации: {len(all_tenders)}")
-
-    # Удаляем дубликаты по _id
-    seen = set()
-    unique_tenders = []
-    for t in all_tenders:
-        tid = t.get('_id')
-        if tid in seen:
-            continue
-        seen.add(tid)
-        unique_tenders.append(t)
-    all_tenders = unique_tenders
-    print(f"После удаления дубликатов: {len(all_tenders)} тендеров")
-    return all_tenders
-
-def fetch_tender_detail(preview: dict) -> dict:
+class DetailUsage:
+    """
+    Счётчики запросов деталей /tenders/get на доставленный тендер:
+    fetched — детали, загруженные для сборки сообщений, from_preview — сообщения
+    из одного превью, on_demand — детали по нажатию «📎 Документы».
+    """
+
+    def __init__(self):
+        self.fetched = 0
+        self.from_preview = 0
+        self.on_demand = 0
+        self.delivered = 0
+
+    def stats(self) -> dict:
+        calls = self.fetched + self.on_demand
+        return {
+            "detail_calls": calls,
+            "from_preview": self.from_preview,
+            "on_demand": self.on_demand,
+            "delivered": self.delivered,
+            "calls_per_delivered": round(calls / self.delivered, 3) if self.delivered else 0.0,
+        }
+
+
+detail_usage = DetailUsage()
+
+
+async def fetch_tender_detail(preview: dict) -> dict:
     """
     Запрашивает полные детали тендера по его ID.
-    Даже если не удаётся получить полную информацию, возвращает минимальные данные,
-    чтобы не нарушать поток логики и сохранить last_ts.
+    Повторы и паузы — в клиенте (resilience). Если деталь так и не загрузилась
+    (или API недоступен), возвращает превью с пометкой _partial — как и отчёт,
+    сообщение собирается из того, что есть, а last_ts сохраняется.
     """
     tid = preview.get('_id')
+    detail_usage.fetched += 1
     try:
-        resp = session.get(
-            f"{BASE_URL}/tenders/get",
-            params={'id': tid},
-            verify=False
-        )
-        resp.raise_for_status()
-        detail = resp.json() or {}
-        # Встраиваем доп. поле со статусом из превью
-        detail['_preview_status'] = preview.get('status', 0)
-        # Если нет важных данных — подстрахуемся, но не возвращаем None
-        if not detail.get("publicationDate"):
-            detail["publicationDate"] = preview.get("publicationDateTime", 0)
-        return detail
-    except Exception as e:
-        logging.warning(f"Ошибка при получении тендера {tid}: {e}")
-        return {
-            "_id": tid,
-            "documents": [],
-            "publicationDate": preview.get("publicationDateTime", 0),
-            "noticeNumber": preview.get("noticeNumber", "—"),
-            "_preview_status": preview.get("status", 0)
-        }
+        detail = await get_client().get_tender(tid)
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        logging.warning(f"Ошибка при получении тендера {tid}, сообщение из превью: {e}")
+        detail = dict(preview, _partial=True)
+    # Встраиваем доп. поле со статусом из превью
+    detail['_preview_status'] = preview.get('status', 0)
+    # Если нет важных данных — подстрахуемся, но не возвращаем None
+    if not detail.get("publicationDate"):
+        detail["publicationDate"] = preview.get("publicationDateTime", 0)
+    return detail
+
+
+def preview_has_message_fields(preview: dict) -> bool:
+    """
+    Хватает ли превью для format_tender_message без запроса детали.
+    """
+    return (all(field in preview for field in MESSAGE_FIELDS)
+            and any(preview.get(field) for field in CLOSE_FIELDS))
+
+
+def tender_close_ts(tender: dict) -> int | None:
+    """
+    Окончание приёма заявок в мс из превью или детали тендера.
+    """
+    return tender.get("submissionCloseDateTime") or tender.get("submissionCloseDate") or None
+
+
+async def message_detail(preview: dict, full: bool = False) -> tuple[dict, list[dict] | None]:
+    """
+    Данные для сообщения о тендере и его вложения. Если превью достаточно (и не нужна
+    полная деталь — full), деталь не запрашивается, а вложения — None:
+    их загрузит кнопка «📎 Документы».
+    """
+    if not full and preview_has_message_fields(preview):
+        detail_usage.from_preview += 1
+        return dict(preview, _preview_status=preview.get("status", 0)), preview.get("attachments")
+    detail = await fetch_tender_detail(preview)
+    if detail.get("_partial"):
+        # вложения неизвестны — кнопка «📎 Документы» попробует загрузить их позже
+        return detail, None
+    return detail, detail.get("attachments", [])
+
+
+async def load_attachments(tender_id: str) -> tuple[list[dict], int | None]:
+    """
+    Вложения тендера по нажатию кнопки и окончание приёма заявок (срок их хранения):
+    деталь из общего кэша или из API.
+    """
+    detail_usage.on_demand += 1
+    detail = await get_client().get_tender(tender_id)
+    return detail.get("attachments", []), tender_close_ts(detail)
 
 
 def format_tender_message(detail: dict) -> str:
@@ -184,25 +198,138 @@ def format_tender_message(detail: dict) -> str:
 
     return "\n".join(lines)
 
-def export_messages(key_id: str) -> list[tuple[str,str,list[dict]]]:
+async def stream_messages(key_id: str, buffer: int = MESSAGE_STREAM_BUFFER
+                          ) -> AsyncIterator[tuple[str, str, list[dict] | None, int | None]]:
     """
-    Собирает все тендеры только со статусом 'Подача заявок' и возвращает список кортежей:
-    (tender_id, formatted_text, attachments_list).
+    Тендеры ключа со статусом «Подача заявок» по мере готовности: (tender_id, formatted_text,
+    attachments_list, close_ts). attachments_list — None, если сообщение собрано из превью
+    и вложения будут загружены по кнопке; close_ts — окончание приёма заявок
+    (до него хранятся вложения для кнопки).
+
+    Конвейер: страницы превью (pagination.iter_previews) → MESSAGE_STREAM_WORKERS задач,
+    собирающих сообщения (детали — под общим адаптивным пределом) → вызывающий.
+    Между этапами — очереди на buffer элементов: пока вызывающий не забирает сообщения,
+    загрузка деталей и страниц приостанавливается, и в памяти не копится вся выдача ключа.
+    Порядок — по готовности, а не по выдаче API.
+
+    Если пагинация оборвалась ошибкой, сначала отдаются уже готовые сообщения, затем ошибка
+    пробрасывается. Генератор нужно закрывать (contextlib.aclosing), если он брошен на середине.
+    В профиль прогона пишутся этапы first_message (время до первого сообщения) и stream.
     """
-    previews = fetch_all_tenders(key_id)
-    messages: list[tuple[str,str,list[dict]]] = []
+    run = start_run("messages", key_id=key_id)
+    previews: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+    ready: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+    done = object()
+    failure: list[Exception] = []
+
+    async def produce():
+        total = 0
+        try:
+            async for page in iter_previews(key_id, require_status=1):
+                for preview in page:
+                    await previews.put(preview)
+                total += len(page)
+        except Exception as e:
+            failure.append(e)
+        print(f"Всего тендеров после пагинации: {total}")
+        for _ in range(MESSAGE_STREAM_WORKERS):
+            await previews.put(done)
 
-    # Параллельная загрузка деталей
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(fetch_tender_detail, p) for p in previews]
-        for fut in as_completed(futures):
+    async def work():
+        while (preview := await previews.get()) is not done:
             try:
-                detail = fut.result()
-                tid  = detail.get("_id", "")
-                text = format_tender_message(detail)
-                atts = detail.get("attachments", [])
-                messages.append((tid, text, atts))
-            except Exception:
-                # можно логировать ошибку
+                detail, atts = await message_detail(preview)
+                item = (detail.get("_id", ""), format_tender_message(detail), atts, tender_close_ts(detail))
+            except Exception as e:
+                logging.warning(f"Тендер {preview.get('_id')} пропущен: {e}")
                 continue
-    return messages
+            await ready.put(item)
+        await ready.put(done)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(work()) for _ in range(MESSAGE_STREAM_WORKERS)]
+    count = finished = 0
+    try:
+        while finished < MESSAGE_STREAM_WORKERS:
+            item = await ready.get()
+            if item is done:
+                finished += 1
+                continue
+            if not count:
+                run.mark("first_message")
+            count += 1
+            yield item
+        run.mark("stream", messages=count)
+        if failure:
+            raise failure[0]
+    except Exception as e:
+        run.error = repr(e)
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        run.finish()
+        logging.info(f"Кэш деталей: {detail_cache.stats()}; детали на тендер: {detail_usage.stats()}; "
+                     f"параллельность: {detail_concurrency.stats()}")
+
+
+async def export_messages(key_id: str) -> list[tuple[str, str, list[dict] | None, int | None]]:
+    """
+    Все сообщения stream_messages одним списком.
+    """
+    async with aclosing(stream_messages(key_id)) as stream:
+        return [message async for message in stream]
+
+
+class MessagePacker:
+    """
+    Пошаговая упаковка тендеров для компактного режима (см. pack_tender_messages):
+    add() возвращает готовое сообщение, как только следующий тендер в него не помещается,
+    flush() — последнее неполное. Нумерация сквозная между сообщениями.
+    """
+
+    def __init__(self, limit: int = TELEGRAM_TEXT_LIMIT):
+        self.limit = limit
+        self.count = 0
+        self._blocks: list[str] = []
+        self._items: list[tuple[int, str, list[dict] | None]] = []
+        self._length = 0
+
+    def add(self, tid: str, text: str, atts: list[dict] | None
+            ) -> tuple[str, list[tuple[int, str, list[dict] | None]]] | None:
+        self.count += 1
+        block = f"<b>{self.count}.</b> {text}"
+        extra = len(block) + (len(PACK_SEPARATOR) if self._blocks else 0)
+        pack = None
+        if self._blocks and self._length + extra > self.limit:
+            pack = self.flush()
+            extra = len(block)
+        self._blocks.append(block)
+        self._items.append((self.count, tid, atts))
+        self._length += extra
+        return pack
+
+    def flush(self) -> tuple[str, list[tuple[int, str, list[dict] | None]]] | None:
+        if not self._blocks:
+            return None
+        pack = (PACK_SEPARATOR.join(self._blocks), self._items)
+        self._blocks, self._items, self._length = [], [], 0
+        return pack
+
+
+def pack_tender_messages(messages: list[tuple[str, str, list[dict] | None]],
+                         limit: int = TELEGRAM_TEXT_LIMIT) -> list[tuple[str, list[tuple[int, str, list[dict] | None]]]]:
+    """
+    Компактный режим: складывает тексты тендеров в как можно меньшее число сообщений
+    не длиннее limit символов. Тендеры нумеруются сквозным номером, чтобы кнопки
+    «Документы» под сообщением можно было сопоставить с тендерами.
+
+    Возвращает [(html_текст, [(номер, tender_id, вложения), ...]), ...].
+    Длина считается по HTML-разметке — это не меньше, чем насчитает Telegram.
+    """
+    packer = MessagePacker(limit)
+    packs = [pack for tid, text, atts in messages if (pack := packer.add(tid, text, atts))]
+    if (last := packer.flush()):
+        packs.append(last)
+    return packs
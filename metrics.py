@@ -0,0 +1,259 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# границы гистограмм, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5)
+LONG_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    Монотонный счётчик. Значения меток передаются позиционно в порядке labels.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    """
+    Текущее значение: set() заменяет, inc() прибавляет.
+    """
+    kind = "gauge"
+
+    def set(self, value: float, *label_values: str):
+        with self._lock:
+            self._values[label_values] = float(value)
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма длительностей с накопительными корзинами, как у Prometheus.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # по меткам: [счётчики по корзинам (последняя — +Inf), сумма, количество]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            item = self._values.get(label_values)
+            if item is None:
+                item = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            item[0][index] += 1
+            item[1] += value
+            item[2] += 1
+
+    @contextmanager
+    def time(self, *label_values: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        lines = self._header()
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Все метрики процесса; render() — текстовый формат Prometheus (version 0.0.4).
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help_text: str, labels: tuple[str, ...] = ()) -> Counter:
+    return registry.register(Counter(name, help_text, labels))
+
+
+def gauge(name: str, help_text: str, labels: tuple[str, ...] = ()) -> Gauge:
+    return registry.register(Gauge(name, help_text, labels))
+
+
+def histogram(name: str, help_text: str, labels: tuple[str, ...] = (),
+              buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, help_text, labels, buckets))
+
+
+# ─── Метрики бота ─────────────────────────────────────────────────────
+# Tenderplan API
+API_REQUEST_SECONDS = histogram(
+    "tenderplan_request_seconds", "Длительность запросов к Tenderplan API", ("endpoint",))
+API_RESPONSES = counter(
+    "tenderplan_responses_total", "Ответы Tenderplan API по кодам; status=error — сетевая ошибка",
+    ("endpoint", "status"))
+API_RATE_LIMITED = counter(
+    "tenderplan_rate_limited_total", "Ответы 429 Too Many Requests от Tenderplan API", ("endpoint",))
+API_RETRIES_TOTAL = counter(
+    "tenderplan_retries_total", "Повторы запросов к Tenderplan API по причинам", ("endpoint", "reason"))
+API_BREAKER_STATE = gauge(
+    "tenderplan_breaker_state", "Состояние предохранителя эндпоинта: 0 — замкнут, 1 — пробный запрос, 2 — разомкнут",
+    ("endpoint",))
+API_LIMITER_WAIT = histogram(
+    "tenderplan_limiter_wait_seconds", "Ожидание токена лимитера квоты перед запросом к API")
+DETAIL_CONCURRENCY = gauge(
+    "tenderplan_concurrency_limit", "Текущий адаптивный предел одновременных запросов (см. concurrency)",
+    ("pool",))
+DETAIL_CONCURRENCY_CUTS = counter(
+    "tenderplan_concurrency_cuts_total", "Снижения адаптивного предела после 429 или всплеска задержки",
+    ("pool",))
+
+# SQLite — только при включённом METRICS_PORT, см. database._connect
+DB_QUERY_SECONDS = histogram(
+    "sqlite_query_seconds", "Время выполнения запросов SQLite (execute, без выборки строк)",
+    ("statement", "table"), DB_BUCKETS)
+
+# Telegram
+TG_SEND_SECONDS = histogram(
+    "telegram_send_seconds", "Длительность вызовов Bot API", ("method",))
+TG_QUEUE_WAIT = histogram(
+    "telegram_queue_wait_seconds", "Время сообщения в очереди отправки до успешной доставки", ("lane",),
+    LATENCY_BUCKETS + (120, 300, 600))
+TG_RETRY_AFTER = counter(
+    "telegram_retry_after_total", "Ответы RetryAfter (flood control) от Telegram")
+TG_SEND_FAILED = counter(
+    "telegram_send_failed_total", "Сообщения, которые не удалось отправить", ("method",))
+
+# подписки
+POLL_CYCLE_SECONDS = histogram(
+    "poll_cycle_seconds", "Длительность цикла check_new_tenders", buckets=LONG_BUCKETS)
+POLL_KEY_TENDERS = counter(
+    "poll_key_tenders_total", "Новые тендеры, найденные по ключу подписки", ("key",))
+POLL_KEY_LAST_TENDERS = gauge(
+    "poll_key_last_tenders", "Новые тендеры по ключу в последнем цикле", ("key",))
+
+# отчёты
+REPORT_STAGE_SECONDS = histogram(
+    "report_stage_seconds", "Длительность этапов generate_report", ("stage",), LONG_BUCKETS)
+
+
+# ─── HTTP-эндпоинт ────────────────────────────────────────────────────
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: ThreadingHTTPServer | None = None
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer | None:
+    """
+    Поднимает /metrics в фоновом потоке; при port=0 (по умолчанию) ничего не делает.
+    """
+    global _server
+    if not port or _server is not None:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Метрики Prometheus: http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+
+def stop_metrics_server():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+    _server = None
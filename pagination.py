@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator
+import httpx
+from config import LIST_PAGE_SIZE, LIST_PAGE_SIZE_MIN, LIST_PAGE_SIZE_MAX, LIST_CONCURRENCY
+from tenderplan_api import get_client
+
+logger = logging.getLogger(__name__)
+
+
+def _close_ts(preview: dict) -> int:
+    return preview.get("submissionCloseDateTime") or preview.get("submissionCloseDate") or 0
+
+
+async def iter_previews(key_id: str, *, now_ts: int | None = None, require_status: int | None = None,
+                        stop_on_closed: bool = True, concurrency: int = LIST_CONCURRENCY,
+                        start_size: int = LIST_PAGE_SIZE, max_size: int = LIST_PAGE_SIZE_MAX,
+                        **params) -> AsyncIterator[list[dict]]:
+    """
+    Превью /tenders/v2/getlist по ключу — по страницам, в порядке выдачи API.
+
+    Отдаются только тендеры, приём заявок по которым не закончился к now_ts
+    (и со статусом require_status, если он задан), без повторов между страницами.
+
+    - первая страница запрашивается одна: у большинства ключей в опросе подписок
+      всё умещается в неё, и лишних запросов не бывает;
+    - пока страницы полные, сначала растёт размер страницы: он удваивается до max_size,
+      как только смещение кратно новому размеру, — страницы по одной, без запросов наугад;
+    - только на max_size страницы идут окнами параллельно (темп держит общий лимитер
+      клиента): окно растёт вдвое после каждого окна полных страниц, до concurrency штук;
+    - страницы окна разбираются по порядку: на первой неполной выдача кончилась,
+      и ещё не отправленные запросы окна отменяются;
+    - если API отвергает большой размер (4xx, кроме 429) или не успевает ответить,
+      размер уменьшается вдвое, не ниже LIST_PAGE_SIZE_MIN, и больше не растёт;
+    - stop_on_closed: страница, на которой не осталось ни одного открытого тендера,
+      считается последней (выдача идёт от новых к старым).
+
+    params передаются в get_tenders_page (например, fromPublicationDateTime).
+    """
+    client = get_client()
+    now_ts = now_ts or int(time.time() * 1000)
+    size = start_size
+    offset = 0
+    window = 1
+    seen: set[str] = set()
+    while True:
+        # окно больше одной страницы только на max_size, так что смещение всегда кратно размеру
+        tasks = [
+            asyncio.create_task(client.get_tenders_page(key_id, offset // size + i, size, **params))
+            for i in range(window)
+        ]
+        try:
+            for task in tasks:
+                try:
+                    page = await task
+                except (httpx.HTTPStatusError, httpx.TimeoutException) as e:
+                    rejected = isinstance(e, httpx.TimeoutException) or (
+                        400 <= e.response.status_code < 500 and e.response.status_code != 429
+                    )
+                    if not rejected or size // 2 < LIST_PAGE_SIZE_MIN:
+                        raise
+                    # больший размер в этой выдаче больше не пробуем
+                    size = max_size = size // 2
+                    window = 1
+                    logger.info(f"getlist по ключу {key_id}: {e!r}, уменьшаем страницу до {size}")
+                    break
+                items = [
+                    t for t in page
+                    if _close_ts(t) > now_ts and (require_status is None or t.get("status") == require_status)
+                ]
+                fresh = [t for t in items if t.get("_id") not in seen]
+                seen.update(t.get("_id") for t in fresh)
+                offset += size
+                if fresh:
+                    yield fresh
+                if len(page) < size or (stop_on_closed and not items):
+                    return
+            else:
+                if size * 2 <= max_size:
+                    if offset % (size * 2) == 0:
+                        size *= 2
+                else:
+                    window = min(concurrency, window * 2)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def collect_previews(key_id: str, **kwargs) -> list[dict]:
+    """
+    Все превью iter_previews одним списком.
+    """
+    return [t async for page in iter_previews(key_id, **kwargs) for t in page]
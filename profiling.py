@@ -0,0 +1,279 @@
+import cProfile
+import contextvars
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from config import PROFILE_LOG, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+# прогон, которому засчитываются запросы к API из текущей задачи и её дочерних задач
+_current: contextvars.ContextVar["ProfileRun | None"] = contextvars.ContextVar("profile_run", default=None)
+
+_lock = threading.Lock()
+# cProfile следующего прогона: взводится командой администратора
+_cprofile_armed = False
+# путь к последнему дампу cProfile
+last_dump: str | None = None
+# сколько прогонов и участков сейчас пользуются tracemalloc; включили ли его мы; в каком процессе
+_tracing_users = 0
+_tracing_ours = False
+_tracing_pid = os.getpid()
+# процесс, в котором сейчас включён cProfile: два профилировщика сразу в одном процессе
+# нельзя (в Python 3.12+ второй enable() бросает «Another profiling tool is already active»)
+_profiler_pid: int | None = None
+
+
+def _start_tracing():
+    global _tracing_users, _tracing_ours, _tracing_pid
+    with _lock:
+        if _tracing_pid != os.getpid():
+            # процесс пула, созданный fork'ом: счётчики родителя здесь не действуют
+            _tracing_pid = os.getpid()
+            _tracing_users = 0
+            _tracing_ours = tracemalloc.is_tracing()
+        _tracing_users += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_ours = True
+
+
+def _stop_tracing():
+    """
+    tracemalloc выключается, только когда закончился последний пользователь, и только если включали его мы.
+    """
+    global _tracing_users, _tracing_ours
+    with _lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_ours:
+            tracemalloc.stop()
+            _tracing_ours = False
+
+
+def _claim_profiler() -> cProfile.Profile | None:
+    """
+    Включённый cProfile или None, если в этом процессе уже работает другой
+    (например, прогона, когда сборка книги идёт в пуле потоков, REPORT_POOL=thread).
+    """
+    global _profiler_pid
+    with _lock:
+        if _profiler_pid == os.getpid():
+            return None
+        _profiler_pid = os.getpid()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # профилировщик включён кем-то ещё, не нами
+        _release_profiler()
+        return None
+    return profiler
+
+
+def _release_profiler():
+    global _profiler_pid
+    with _lock:
+        _profiler_pid = None
+
+
+def _take_peak(entry: dict):
+    """
+    Пишет в entry пик памяти с прошлого сброса. Пик у tracemalloc один на процесс, поэтому
+    сбрасывается он, только когда трассирует один пользователь; иначе пик общий
+    с одновременными прогонами, и entry помечается peak_shared.
+    """
+    if not tracemalloc.is_tracing():
+        return
+    entry["peak_mem_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+    with _lock:
+        alone = _tracing_users == 1
+    if alone:
+        tracemalloc.reset_peak()
+    else:
+        entry["peak_shared"] = True
+
+
+def _dump_path(name: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.prof")
+
+
+class ProfileRun:
+    """
+    Один прогон отчёта или выгрузки сообщениями, разбитый на этапы.
+
+    mark(stage) закрывает этап, начатый предыдущей отметкой, и возвращает его длительность;
+    с включённым PROFILE_LOG для этапа запоминаются ещё число запросов к API и пик памяти
+    (tracemalloc, см. _take_peak), а finish() дописывает прогон строкой JSON в PROFILE_LOG.
+    Работа, ушедшая в пул (сборка книги), профилируется там же (profiled_section),
+    а её дамп cProfile добавляется к дампу прогона через attach_dump.
+    """
+
+    def __init__(self, name: str, enabled: bool, cprofile: bool = False, **meta):
+        self.name = name
+        self.meta = meta
+        self.enabled = enabled
+        self.started_at = time.time()
+        self.started = self._mark = time.perf_counter()
+        self.stages: list[dict] = []
+        self.api_calls = 0
+        self._mark_calls = 0
+        self.error: str | None = None
+        self._profiler: cProfile.Profile | None = None
+        self._child_dumps: list[str] = []
+        self._token: contextvars.Token | None = None
+        if enabled:
+            _start_tracing()
+            _take_peak({})
+        if cprofile:
+            self._profiler = _claim_profiler()
+            if self._profiler is None:
+                logger.warning(f"cProfile прогона {name} не включён: уже работает другой профилировщик")
+
+    def mark(self, stage: str, **extra) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._mark
+        if self.enabled:
+            entry = {"stage": stage, "wall": round(elapsed, 4), "api_calls": self.api_calls - self._mark_calls}
+            if "peak_mem_kb" not in extra:
+                # пик этапа, замеренный там, где он выполнялся (процесс пула), точнее общего
+                _take_peak(entry)
+            entry.update(extra)
+            self.stages.append(entry)
+        self._mark = now
+        self._mark_calls = self.api_calls
+        return elapsed
+
+    def reset_mark(self):
+        """
+        Следующий этап начинается отсюда: время с прошлой отметки никуда не записывается.
+        """
+        self._mark = time.perf_counter()
+        self._mark_calls = self.api_calls
+
+    @property
+    def cprofile(self) -> bool:
+        return self._profiler is not None
+
+    def attach_dump(self, path: str | None):
+        """
+        Дамп cProfile участка из пула потоков или процессов: войдёт в дамп прогона.
+        """
+        if path:
+            self._child_dumps.append(path)
+
+    def finish(self):
+        global last_dump
+        wall = time.perf_counter() - self.started
+        record = {
+            "run": self.name,
+            "started_at": round(self.started_at, 3),
+            "wall": round(wall, 4),
+            "api_calls": self.api_calls,
+            "stages": self.stages,
+            **self.meta,
+        }
+        if self.error:
+            record["error"] = self.error
+        if self._profiler is not None:
+            self._profiler.disable()
+            _release_profiler()
+            path = _dump_path(self.name)
+            stats = pstats.Stats(self._profiler)
+            for child in self._child_dumps:
+                stats.add(child)
+                os.remove(child)
+            stats.dump_stats(path)
+            last_dump = record["cprofile"] = path
+            logger.info(f"cProfile прогона {self.name} сохранён в {path}")
+        if self.enabled:
+            _stop_tracing()
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                # прогон завершён из другого контекста (например, брошенный генератор закрыт позже)
+                pass
+            self._token = None
+        if self.enabled and PROFILE_LOG:
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            with _lock, open(PROFILE_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def start_run(name: str, **meta) -> ProfileRun:
+    """
+    Начинает прогон и делает его текущим для задачи (и созданных из неё задач).
+    Без PROFILE_LOG и cProfile прогон только меряет длительности этапов.
+    """
+    global _cprofile_armed
+    with _lock:
+        cprofile, _cprofile_armed = _cprofile_armed, False
+    run = ProfileRun(name, enabled=bool(PROFILE_LOG) or cprofile, cprofile=cprofile, **meta)
+    run._token = _current.set(run)
+    return run
+
+
+@contextmanager
+def profiled_section(name: str, cprofile: bool = False, trace_memory: bool = False):
+    """
+    Профилирует участок прогона, выполняемый в пуле потоков или процессов: cProfile
+    родительского прогона и его пик памяти туда не дотягиваются.
+    Отдаёт словарь, который после выхода содержит cprofile (путь к дампу для
+    ProfileRun.attach_dump) и peak_mem_kb (с peak_shared, если пик общий с другими).
+    В пуле потоков cProfile прогона уже включён в этом процессе, и участок его не включает:
+    дампа тогда нет.
+    """
+    info: dict = {}
+    if trace_memory:
+        _start_tracing()
+        _take_peak({})
+    profiler = _claim_profiler() if cprofile else None
+    try:
+        yield info
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _release_profiler()
+            info["cprofile"] = _dump_path(name)
+            profiler.dump_stats(info["cprofile"])
+        if trace_memory:
+            _take_peak(info)
+            _stop_tracing()
+
+
+def count_api_call():
+    """
+    Засчитывает запрос к API текущему прогону, если он есть.
+    """
+    run = _current.get()
+    if run is not None:
+        run.api_calls += 1
+
+
+def arm_cprofile():
+    """
+    Следующий прогон отчёта или выгрузки будет записан в cProfile.
+    """
+    global _cprofile_armed
+    with _lock:
+        _cprofile_armed = True
+
+
+def cprofile_armed() -> bool:
+    return _cprofile_armed
+
+
+def dump_summary(path: str, limit: int = 20) -> str:
+    """
+    Верхние limit функций дампа по накопленному времени — текстом для чата.
+    """
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import threading
+import time
+from config import API_RATE_LIMIT, API_RATE_WINDOW, API_RATE_BURST
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket с O(1) резервированием, общий для потоков и asyncio.
+
+    Под блокировкой выполняется только арифметика: вызывающий «бронирует» токен
+    (баланс может уйти в минус — это очередь будущих токенов), а ждёт уже вне
+    блокировки — time.sleep в потоке или asyncio.sleep в корутине.
+    За любое окно T пропускается не больше capacity + rate * T запросов.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        # статистика ожиданий
+        self.calls = 0
+        self.waited_calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _reserve(self) -> float:
+        """
+        Забирает один токен и возвращает, сколько секунд нужно подождать до его появления.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.calls += 1
+            if wait > 0:
+                self.waited_calls += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+        if wait > 1:
+            logger.info(f"Rate limit: ожидание {wait:.2f} с")
+        return wait
+
+    def acquire(self) -> float:
+        """
+        Блокирующее ожидание для потоков. Возвращает время ожидания, с.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """
+        Неблокирующее ожидание для корутин. Возвращает время ожидания, с.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "waited_calls": self.waited_calls,
+                "total_wait": round(self.total_wait, 3),
+                "avg_wait": round(self.total_wait / self.waited_calls, 3) if self.waited_calls else 0.0,
+                "max_wait": round(self.max_wait, 3),
+            }
+
+
+# Единый лимитер квоты Tenderplan (250 запросов / 10 с) для всего процесса.
+# Запас на «всплеск» вычитается из скорости, чтобы за любые API_RATE_WINDOW секунд
+# не уйти дальше API_RATE_LIMIT запросов.
+api_limiter = TokenBucket(
+    rate=(API_RATE_LIMIT - API_RATE_BURST) / API_RATE_WINDOW,
+    capacity=API_RATE_BURST,
+)
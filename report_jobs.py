@@ -0,0 +1,249 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config import REPORT_WORKERS, REPORT_POOL, REPORT_CACHE_TTL
+from Parser import generate_report
+
+logger = logging.getLogger(__name__)
+
+# ─── Состояния задания ────────────────────────────────────────────────
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+STATE_LABELS = {
+    QUEUED: "в очереди",
+    RUNNING: "формируется",
+    DONE: "готов",
+    FAILED: "ошибка",
+}
+
+# сколько завершённых заданий держим для /reports
+HISTORY_SIZE = 200
+
+
+class ReportJob:
+    """
+    Задание на отчёт по ключу. listeners — корутины listener(job),
+    которые вызываются при каждой смене состояния. Одно задание может
+    обслуживать несколько чатов: chat_id — кто его создал, chat_ids — все,
+    кто ждёт этот отчёт.
+    """
+
+    def __init__(self, job_id: int, key_id: str, chat_id: int, fmt: str = "xlsx"):
+        self.id = job_id
+        self.key_id = key_id
+        self.fmt = fmt
+        self.chat_id = chat_id
+        self.chat_ids = {chat_id}
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.result: bytes | None = None
+        self.filename: str | None = None
+        # сколько тендеров в отчёте без деталей (API не ответил); такой отчёт не кэшируется
+        self.missing = 0
+        self.error: str | None = None
+        # file_id документа после первой отправки: повторно файл в Telegram не заливаем
+        self.file_id: str | None = None
+        self.listeners: list = []
+
+    @property
+    def coalesce_key(self) -> tuple[str, str]:
+        return self.key_id, self.fmt
+
+    @property
+    def duration(self) -> float | None:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class ReportJobManager:
+    """
+    Очередь заданий на отчёты.
+
+    Сетевая часть (пагинация и детали) идёт в event loop через async-клиент,
+    сборка книги — в пуле процессов или потоков (REPORT_POOL), поэтому бот
+    остаётся отзывчивым, пока параллельно строятся несколько отчётов.
+    Одновременно выполняется не больше REPORT_WORKERS заданий.
+
+    Запросы одного и того же отчёта (ключ + формат) схлопываются: пока задание
+    в очереди или строится, новые запросы подписываются на него, а готовый
+    отчёт ещё REPORT_CACHE_TTL секунд отдаётся без повторной генерации.
+    """
+
+    def __init__(self, workers: int = REPORT_WORKERS, pool: str = REPORT_POOL,
+                 cache_ttl: float = REPORT_CACHE_TTL):
+        self.workers = workers
+        self.pool_kind = pool
+        self.cache_ttl = cache_ttl
+        self.jobs: dict[int, ReportJob] = {}
+        # (key_id, fmt) -> задание в очереди или в работе
+        self._inflight: dict[tuple[str, str], ReportJob] = {}
+        # (key_id, fmt) -> последний готовый отчёт, пока не устарел
+        self._ready: dict[tuple[str, str], ReportJob] = {}
+        self._pending_notifies: set[asyncio.Task] = set()
+        self.coalesced = 0
+        self.cache_hits = 0
+        self._ids = itertools.count(1)
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._pool = None
+
+    def _ensure_started(self):
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        if self.pool_kind == "process":
+            # spawn: форк процесса с живым event loop и потоками небезопасен
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, key_id: str, chat_id: int, listener=None, fmt: str = "xlsx") -> ReportJob:
+        """
+        Ставит отчёт в очередь и сразу возвращает задание.
+
+        Если такой же отчёт уже строится — подписывает listener на него;
+        если свежий отчёт уже готов — отдаёт его, listener вызывается сразу.
+        """
+        self._ensure_started()
+        key = (key_id, fmt)
+
+        job = self._inflight.get(key)
+        if job is not None:
+            job.chat_ids.add(chat_id)
+            if listener is not None:
+                job.listeners.append(listener)
+            self.coalesced += 1
+            logger.info(f"Запрос отчёта по ключу {key_id} присоединён к заданию #{job.id}")
+            return job
+
+        job = self._fresh(key)
+        if job is not None:
+            job.chat_ids.add(chat_id)
+            self.cache_hits += 1
+            logger.info(f"Отчёт по ключу {key_id} отдан из кэша задания #{job.id}")
+            if listener is not None:
+                task = asyncio.create_task(self._notify_one(listener, job))
+                self._pending_notifies.add(task)
+                task.add_done_callback(self._pending_notifies.discard)
+            return job
+
+        job = ReportJob(next(self._ids), key_id, chat_id, fmt)
+        if listener is not None:
+            job.listeners.append(listener)
+        self.jobs[job.id] = job
+        self._inflight[key] = job
+        self._queue.put_nowait(job)
+        self._trim_history()
+        logger.info(f"Отчёт #{job.id} по ключу {key_id} поставлен в очередь")
+        return job
+
+    def position(self, job: ReportJob) -> int:
+        """
+        Сколько заданий стоит в очереди перед этим.
+        """
+        return sum(1 for j in self.jobs.values() if j.state == QUEUED and j.id < job.id)
+
+    def user_jobs(self, chat_id: int, limit: int = 10) -> list[ReportJob]:
+        jobs = [j for j in self.jobs.values() if chat_id in j.chat_ids]
+        return sorted(jobs, key=lambda j: j.id, reverse=True)[:limit]
+
+    def _fresh(self, key: tuple[str, str]) -> ReportJob | None:
+        """
+        Готовый отчёт по ключу, если он ещё не устарел; устаревший освобождается.
+        """
+        job = self._ready.get(key)
+        if job is None:
+            return None
+        if time.time() - job.finished_at < self.cache_ttl:
+            return job
+        del self._ready[key]
+        job.result = None
+        return None
+
+    def _trim_history(self):
+        for key in list(self._ready):
+            self._fresh(key)
+        finished = sorted(
+            (j for j in self.jobs.values() if j.state in (DONE, FAILED)),
+            key=lambda j: j.id
+        )
+        for job in finished[:max(0, len(finished) - HISTORY_SIZE)]:
+            del self.jobs[job.id]
+
+    async def _notify_one(self, listener, job: ReportJob):
+        try:
+            await listener(job)
+        except Exception:
+            logger.exception(f"Ошибка при уведомлении об отчёте #{job.id}")
+
+    async def _notify(self, job: ReportJob):
+        for listener in list(job.listeners):
+            await self._notify_one(listener, job)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.state = RUNNING
+            job.started_at = time.time()
+            await self._notify(job)
+            try:
+                report, _ = await generate_report(job.key_id, executor=self._pool)
+                job.result = report.getvalue()
+                job.filename = report.name
+                job.missing = report.missing
+                job.state = DONE
+            except Exception as e:
+                logger.exception(f"Отчёт #{job.id} по ключу {job.key_id} не сформирован")
+                job.error = str(e)
+                job.state = FAILED
+            job.finished_at = time.time()
+            # с этого момента новые запросы идут уже в кэш готовых, а не в это задание
+            self._inflight.pop(job.coalesce_key, None)
+            if job.state == DONE and not job.missing and self.cache_ttl > 0:
+                self._ready[job.coalesce_key] = job
+            logger.info(
+                f"Отчёт #{job.id}: {STATE_LABELS[job.state]} за {job.duration:.1f} с, "
+                f"чатов: {len(job.chat_ids)}"
+            )
+            await self._notify(job)
+            job.listeners.clear()
+            if self._ready.get(job.coalesce_key) is not job:
+                # файл уже отправлен слушателям и в кэше не нужен — не держим его в памяти
+                job.result = None
+            self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "cached": len(self._ready),
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+        }
+
+    async def shutdown(self):
+        for task in self._tasks + list(self._pending_notifies):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._pending_notifies, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._queue = None
+        self._tasks = []
+        self._inflight.clear()
+        self._ready.clear()
+        self._pool = None
+
+
+report_jobs = ReportJobManager()
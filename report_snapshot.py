@@ -0,0 +1,58 @@
+import hashlib
+import json
+import time
+import zlib
+from database import get_connection
+
+
+def preview_fingerprint(preview: dict) -> str:
+    """
+    Отпечаток содержимого превью: меняется вместе с любым полем тендера в выдаче getlist.
+    """
+    raw = json.dumps(preview, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def load_snapshot(key_id: str) -> dict[str, tuple[str, dict]]:
+    """
+    Снимок прошлого отчёта по ключу: {tender_id: (fingerprint, detail)}.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT tender_id, fingerprint, detail FROM report_snapshots WHERE key_id = ?",
+            (key_id,)
+        ).fetchall()
+    return {
+        tid: (fingerprint, json.loads(zlib.decompress(detail)))
+        for tid, fingerprint, detail in rows
+    }
+
+
+def save_snapshot(key_id: str, entries: list[tuple[dict, dict]]):
+    """
+    Полностью заменяет снимок ключа текущим набором (preview, detail).
+    Тендеры, выпавшие из выдачи, из снимка удаляются.
+    """
+    now = int(time.time())
+    rows = []
+    for preview, detail in entries:
+        rows.append((
+            key_id,
+            preview["_id"],
+            preview.get("status", 0),
+            preview.get("submissionCloseDateTime") or preview.get("submissionCloseDate") or 0,
+            preview_fingerprint(preview),
+            zlib.compress(json.dumps(detail, ensure_ascii=False).encode("utf-8")),
+            now,
+        ))
+    with get_connection() as conn:
+        conn.execute("DELETE FROM report_snapshots WHERE key_id = ?", (key_id,))
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO report_snapshots
+                (key_id, tender_id, status, close_ts, fingerprint, detail, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+        conn.commit()
@@ -0,0 +1,141 @@
+from copy import copy
+from functools import lru_cache
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from config import TEMPLATE_PATH
+
+# строки шаблона: 1–2 — шапка, с 3-й — данные (чередование заливки через строку)
+HEADER_ROWS = 2
+BODY_STYLE_ROWS = (3, 4)
+# ограничение Excel на строковый аргумент формулы
+FORMULA_STRING_LIMIT = 255
+
+
+class _TemplateLayout:
+    """
+    Всё, что берём из шаблона: шапку со стилями, стили строк данных и разметку листа.
+    """
+
+    def __init__(self, template_path: str):
+        wb = openpyxl.load_workbook(template_path)
+        ws = wb.active
+        self.title = ws.title
+        self.max_column = ws.max_column
+        self.header = [
+            [(cell.value, cell) for cell in row]
+            for row in ws.iter_rows(min_row=1, max_row=HEADER_ROWS, max_col=self.max_column)
+        ]
+        self.body = [
+            [cell for cell in row]
+            for r in BODY_STYLE_ROWS
+            for row in ws.iter_rows(min_row=r, max_row=r, max_col=self.max_column)
+        ]
+        self.widths = {k: d.width for k, d in ws.column_dimensions.items() if d.width}
+        self.heights = {
+            r: ws.row_dimensions[r].height
+            for r in range(1, HEADER_ROWS + 1) if ws.row_dimensions[r].height
+        }
+        self.merged = [str(rng) for rng in ws.merged_cells.ranges]
+        self.auto_filter = ws.auto_filter.ref
+        self.freeze_panes = ws.freeze_panes
+
+
+@lru_cache(maxsize=4)
+def _layout(template_path: str) -> _TemplateLayout:
+    return _TemplateLayout(template_path)
+
+
+def _hyperlink_formula(url: str, text) -> str:
+    quote = lambda v: str(v).replace('"', '""')
+    return f'=HYPERLINK("{quote(url)}","{quote(text if text not in (None, "") else url)}")'
+
+
+def _copy_style(src, dst):
+    if src.has_style:
+        dst.font = copy(src.font)
+        dst.fill = copy(src.fill)
+        dst.border = copy(src.border)
+        dst.alignment = copy(src.alignment)
+        dst.protection = copy(src.protection)
+        dst.number_format = src.number_format
+
+
+class ReportWriter:
+    """
+    Потоковая запись отчёта по шаблону в режиме write-only openpyxl.
+
+    Шапка, ширины столбцов, объединения и стили строк данных берутся из шаблона,
+    строки пишутся по одной и не держатся в памяти целиком.
+    Сохранять можно в путь или в файловый объект (например, io.BytesIO).
+
+    Ссылки пишутся формулой HYPERLINK: обычные гиперссылки openpyxl хранит списком
+    relationships, который пересобирается при каждом добавлении, и на тысячах строк
+    это квадратичное время. Слишком длинные для формулы адреса остаются гиперссылками.
+    """
+
+    def __init__(self, template_path: str = TEMPLATE_PATH):
+        layout = _layout(template_path)
+        self.wb = openpyxl.Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(layout.title)
+        for letter, width in layout.widths.items():
+            self.ws.column_dimensions[letter].width = width
+        for r, height in layout.heights.items():
+            self.ws.row_dimensions[r].height = height
+        for rng in layout.merged:
+            self.ws.merged_cells.add(rng)
+        if layout.auto_filter:
+            self.ws.auto_filter.ref = layout.auto_filter
+        if layout.freeze_panes:
+            self.ws.freeze_panes = layout.freeze_panes
+
+        for row in layout.header:
+            cells = []
+            for value, src in row:
+                cell = WriteOnlyCell(self.ws, value)
+                _copy_style(src, cell)
+                cells.append(cell)
+            self.ws.append(cells)
+
+        self.letters = [get_column_letter(i) for i in range(1, layout.max_column + 1)]
+        # прототипы стилей строк данных: стиль регистрируется в книге один раз,
+        # дальше ячейкам копируется только ссылка на него
+        self._stripes = []
+        for src_row in layout.body:
+            protos = []
+            for src in src_row:
+                proto = WriteOnlyCell(self.ws)
+                _copy_style(src, proto)
+                protos.append(proto)
+            self._stripes.append(protos)
+        self.rows = 0
+
+    def write_row(self, values: dict, links: dict | None = None, formats: dict | None = None):
+        """
+        Дописывает строку данных. values / links / formats — словари по букве столбца.
+        """
+        links = links or {}
+        formats = formats or {}
+        protos = self._stripes[self.rows % len(self._stripes)]
+        cells = []
+        for letter, proto in zip(self.letters, protos):
+            value = values.get(letter)
+            url = links.get(letter)
+            if url and len(url) <= FORMULA_STRING_LIMIT and len(str(value or "")) <= FORMULA_STRING_LIMIT:
+                value, url = _hyperlink_formula(url, value), None
+            cell = WriteOnlyCell(self.ws, value)
+            cell._style = copy(proto._style)
+            if letter in formats:
+                cell.number_format = formats[letter]
+            if url:
+                cell.hyperlink = url
+            cells.append(cell)
+        self.ws.append(cells)
+        self.rows += 1
+
+    def save(self, target):
+        """
+        Сохраняет книгу в путь или файловый объект. Write-only книгу можно сохранить один раз.
+        """
+        self.wb.save(target)
+        return target
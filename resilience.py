@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+from config import (
+    API_RETRIES, API_BACKOFF_BASE, API_BACKOFF_MAX, API_RETRY_AFTER_MAX,
+    API_BREAKER_THRESHOLD, API_BREAKER_RESET,
+)
+from metrics import API_RETRIES_TOTAL, API_BREAKER_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """
+    Запрос не отправлен: предохранитель эндпоинта разомкнут, API недавно не отвечал.
+    """
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Tenderplan API недоступен ({endpoint}), следующая попытка через {retry_in:.0f} с")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Предохранитель одного эндпоинта.
+
+    - closed: запросы идут, подряд идущие сбои (5xx, сетевые ошибки, таймауты) считаются;
+    - после threshold сбоев подряд — open: запросы сразу получают CircuitOpenError;
+    - через reset секунд — half_open: пропускается один пробный запрос;
+      успех замыкает предохранитель, сбой снова размыкает его.
+
+    429 сбоем не считается: API жив, просто просит сбавить темп.
+    """
+
+    def __init__(self, endpoint: str, threshold: int = API_BREAKER_THRESHOLD, reset: float = API_BREAKER_RESET):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.reset = reset
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe = False
+        # статистика
+        self.opened = 0
+        self.rejected = 0
+        API_BREAKER_STATE.set(0, endpoint)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Предохранитель {self.endpoint}: {self.state} → {state}")
+        self.state = state
+        API_BREAKER_STATE.set(BREAKER_STATE_VALUES[state], self.endpoint)
+
+    def before_call(self):
+        """
+        Бросает CircuitOpenError, если запрос сейчас отправлять нельзя.
+        Возвращает True, если этот запрос — пробный.
+        """
+        if self.state == CLOSED:
+            return False
+        retry_in = self.opened_at + self.reset - time.monotonic()
+        if self.state == OPEN and retry_in <= 0:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probe:
+            self._probe = True
+            return True
+        self.rejected += 1
+        raise CircuitOpenError(self.endpoint, max(retry_in, 0.0))
+
+    def release_probe(self):
+        """
+        Пробный запрос отменён, не дойдя до ответа: следующий вызов может стать пробным.
+        """
+        self._probe = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probe = False
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe = False
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            if self.state != OPEN:
+                self.opened += 1
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+def retry_after_seconds(response: httpx.Response) -> float | None:
+    """
+    Значение заголовка Retry-After в секундах (число секунд или HTTP-дата), None — если его нет.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """
+    Пауза перед повтором номер attempt (с нуля): экспонента с полным джиттером,
+    не больше API_BACKOFF_MAX. Если сервер прислал Retry-After, ждём не меньше него
+    (но не дольше API_RETRY_AFTER_MAX) плюс небольшой джиттер, чтобы повторы
+    разных корутин не пришли одной пачкой.
+    """
+    delay = random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = min(retry_after, API_RETRY_AFTER_MAX) + random.uniform(0, API_BACKOFF_BASE)
+    return delay
+
+
+def is_failure(error: Exception) -> bool:
+    """
+    Сбой API (для предохранителя): 5xx, сетевая ошибка или таймаут.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Стоит ли повторять: сбои API и 429. Остальные 4xx — ошибка самого запроса.
+    """
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+        return True
+    return is_failure(error)
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+
+async def call_with_retries(endpoint: str, attempt_call, retries: int = API_RETRIES):
+    """
+    Выполняет attempt_call() — корутинную функцию одной попытки запроса к endpoint —
+    с общей политикой повторов и предохранителем эндпоинта.
+    Бросает CircuitOpenError, если предохранитель разомкнут, или последнюю ошибку попытки.
+    """
+    breaker = breaker_for(endpoint)
+    for attempt in range(retries + 1):
+        probe = breaker.before_call()
+        try:
+            result = await attempt_call()
+        except asyncio.CancelledError:
+            if probe:
+                breaker.release_probe()
+            raise
+        except Exception as e:
+            if is_failure(e):
+                breaker.record_failure()
+            else:
+                # 4xx и прочее — API ответил, значит он жив
+                breaker.record_success()
+            if not is_retryable(e) or attempt == retries:
+                raise
+            retry_after = None
+            if isinstance(e, httpx.HTTPStatusError):
+                retry_after = retry_after_seconds(e.response)
+                reason = str(e.response.status_code)
+            else:
+                reason = type(e).__name__
+            delay = backoff_delay(attempt, retry_after)
+            API_RETRIES_TOTAL.inc(endpoint, reason)
+            logger.info(f"{endpoint}: {reason}, повтор {attempt + 1}/{retries} через {delay:.1f} с")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def breaker_stats() -> dict:
+    return {endpoint: breaker.stats() for endpoint, breaker in _breakers.items()}
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import math
+import threading
+from config import SENT_FILTER_ERROR_RATE, SENT_FILTER_MIN_CAPACITY
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: «точно нет» или «возможно есть» с долей ложных срабатываний
+    около error_rate, пока элементов не больше capacity.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(1, capacity)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # двойное хеширование: k позиций из двух 64-битных половин одного blake2b
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SentFilter:
+    """
+    Фильтр Блума по парам (tg_user_id, tender_id) из sent_tenders.
+
+    Стоит перед запросами в базу: пару, которой точно нет в фильтре, можно не
+    проверять в SQLite. Удалять из фильтра Блума нельзя, поэтому после чистки
+    таблицы он пересобирается (rebuild); добавления, пришедшие во время
+    пересборки, переносятся в новый фильтр.
+
+    Первая сборка читает всю таблицу, поэтому бот делает её при старте в отдельном
+    потоке (on_startup); ленивая сборка в might_contain / add — только запасной путь.
+    """
+
+    def __init__(self, error_rate: float = SENT_FILTER_ERROR_RATE,
+                 min_capacity: int = SENT_FILTER_MIN_CAPACITY):
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self._bloom: BloomFilter | None = None
+        self._pending: list[str] | None = None
+        # RLock: ленивая первая сборка держит его и вызывает rebuild, который берёт его снова
+        self._lock = threading.RLock()
+        self.checks = 0
+        self.skipped = 0
+        self.false_positives = 0
+
+    @staticmethod
+    def _item(user_id: int, tender_id: str) -> str:
+        return f"{user_id}:{tender_id}"
+
+    def rebuild(self):
+        """
+        Заново строит фильтр по текущему содержимому sent_tenders.
+        """
+        with self._lock:
+            self._pending = []
+        with get_connection() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM sent_tenders").fetchone()[0]
+            # запас вдвое, чтобы до следующей пересборки доля ложных срабатываний не росла
+            bloom = BloomFilter(max(self.min_capacity, total * 2), self.error_rate)
+            for user_id, tender_id in conn.execute("SELECT tg_user_id, tender_id FROM sent_tenders"):
+                bloom.add(self._item(user_id, tender_id))
+        with self._lock:
+            for item in self._pending:
+                bloom.add(item)
+            self._pending = None
+            self._bloom = bloom
+        logger.info(f"Фильтр sent_tenders пересобран: {total} записей, {len(bloom.bits) // 1024} КБ")
+
+    def _ensure_loaded(self):
+        if self._bloom is not None:
+            return
+        with self._lock:
+            # под замком: одновременные первые вызовы строят фильтр один раз
+            if self._bloom is None:
+                self.rebuild()
+
+    def might_contain(self, user_id: int, tender_id: str) -> bool:
+        """
+        False — пара точно не отправлялась; True — нужно проверить в базе.
+        """
+        self._ensure_loaded()
+        self.checks += 1
+        if self._item(user_id, tender_id) in self._bloom:
+            return True
+        self.skipped += 1
+        return False
+
+    def add(self, user_id: int, tender_id: str):
+        """
+        Добавляет пару; вызывать после того, как запись в sent_tenders закоммичена.
+        """
+        self._ensure_loaded()
+        item = self._item(user_id, tender_id)
+        with self._lock:
+            self._bloom.add(item)
+            if self._pending is not None:
+                self._pending.append(item)
+
+    def stats(self) -> dict:
+        return {
+            "items": self._bloom.count if self._bloom else 0,
+            "checks": self.checks,
+            "skipped": self.skipped,
+            "false_positives": self.false_positives,
+        }
+
+
+sent_filter = SentFilter()
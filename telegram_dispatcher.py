@@ -0,0 +1,319 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from telegram.error import RetryAfter, BadRequest, Forbidden, NetworkError, TimedOut
+from config import (
+    TG_GLOBAL_LIMIT, TG_GLOBAL_BURST, TG_CHAT_RATE, TG_CHAT_BURST, TG_GROUP_RATE,
+    TG_SEND_CONCURRENCY, TG_SEND_RETRIES,
+)
+from rate_limiter import TokenBucket
+from metrics import TG_SEND_SECONDS, TG_QUEUE_WAIT, TG_RETRY_AFTER, TG_SEND_FAILED
+
+logger = logging.getLogger(__name__)
+
+# ─── Полосы приоритета ────────────────────────────────────────────────
+# ответы на действия пользователя уходят раньше фоновой рассылки подписок
+INTERACTIVE = 0
+BACKGROUND = 1
+LANES = (INTERACTIVE, BACKGROUND)
+LANE_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# TimedOut у этих методов не повторяется: запрос мог дойти, и повтор задвоил бы сообщение
+NON_IDEMPOTENT_PREFIX = "send_"
+
+# как часто забывать состояние чатов, которым давно нечего отправлять, секунды
+PRUNE_INTERVAL = 60
+
+
+class _Outgoing:
+    __slots__ = ("call", "kwargs", "lane", "future", "enqueued_at", "attempts")
+
+    def __init__(self, call, kwargs: dict, lane: int, future: asyncio.Future):
+        self.call = call
+        self.kwargs = kwargs
+        self.lane = lane
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class _Chat:
+    """
+    Очередь и token bucket одного чата. В полёте не больше одного сообщения чата,
+    поэтому порядок сообщений внутри чата сохраняется.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lanes = tuple(deque() for _ in LANES)
+        self.busy = False
+        self.blocked_until = 0.0
+        # номер актуальной записи чата в куче планировщика, старые записи пропускаются
+        self.version = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        self._refill(now)
+        token_at = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(token_at, self.blocked_until)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def best_lane(self) -> int | None:
+        for lane in LANES:
+            if self.lanes[lane]:
+                return lane
+        return None
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return (not self.busy and self.best_lane() is None
+                and self.tokens >= self.burst and self.blocked_until <= now)
+
+
+class OutboundDispatcher:
+    """
+    Единая очередь исходящих сообщений в Telegram.
+
+    - общий лимит бота (token bucket из rate_limiter) и отдельный лимит на каждый чат,
+      для групп — свой, более строгий;
+    - две полосы: INTERACTIVE обслуживается раньше BACKGROUND;
+    - RetryAfter не теряет сообщение: чат и вся отправка ставятся на паузу на указанное
+      время, сообщение возвращается в начало очереди своего чата; сетевые ошибки
+      повторяются с экспоненциальной паузой, не больше TG_SEND_RETRIES раз;
+    - stats() — глубина очередей, отправлено, ошибки, среднее ожидание в очереди.
+
+    Отправка — любой метод бота, принимающий chat_id: send_message, send_document...
+    """
+
+    def __init__(self, global_limit: float = TG_GLOBAL_LIMIT, global_burst: int = TG_GLOBAL_BURST,
+                 chat_rate: float = TG_CHAT_RATE, chat_burst: int = TG_CHAT_BURST,
+                 group_rate: float = TG_GROUP_RATE, concurrency: int = TG_SEND_CONCURRENCY,
+                 retries: int = TG_SEND_RETRIES):
+        # как и у api_limiter, запас на всплеск вычитается из скорости:
+        # за любую секунду уходит не больше global_limit сообщений
+        self.limiter = TokenBucket(rate=global_limit - global_burst, capacity=global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.concurrency = concurrency
+        self.retries = retries
+        self._chats: dict[int, _Chat] = {}
+        self._heaps: tuple[list, ...] = tuple([] for _ in LANES)
+        self._seq = itertools.count()
+        self._task: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._inflight: set[asyncio.Task] = set()
+        self._paused_until = 0.0
+        self._pruned_at = time.monotonic()
+        # метрики
+        self.sent = 0
+        self.failed = 0
+        self.retry_after = 0
+        self.retried = 0
+        self.max_depth = 0
+        self.total_queue_wait = 0.0
+
+    def _ensure_started(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, chat_id: int, call, lane: int = INTERACTIVE, **kwargs) -> asyncio.Future:
+        """
+        Ставит вызов call(chat_id=chat_id, **kwargs) в очередь чата и сразу возвращает
+        future с результатом (Message) или исключением, если отправить не удалось.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            rate, burst = (self.group_rate, 1) if chat_id < 0 else (self.chat_rate, self.chat_burst)
+            chat = self._chats[chat_id] = _Chat(rate, burst)
+        chat.lanes[lane].append(_Outgoing(call, kwargs, lane, future))
+        self._schedule(chat_id, chat)
+        self.max_depth = max(self.max_depth, self.depth())
+        self._wakeup.set()
+        return future
+
+    async def send(self, chat_id: int, call, lane: int = INTERACTIVE, **kwargs):
+        """
+        Ставит сообщение в очередь и ждёт, пока оно будет отправлено.
+        """
+        return await self.enqueue(chat_id, call, lane, **kwargs)
+
+    def depth(self, lane: int | None = None) -> int:
+        lanes = LANES if lane is None else (lane,)
+        return sum(len(chat.lanes[l]) for chat in self._chats.values() for l in lanes)
+
+    def _schedule(self, chat_id: int, chat: _Chat):
+        if chat.busy:
+            return
+        lane = chat.best_lane()
+        if lane is None:
+            return
+        chat.version += 1
+        ready_at = chat.ready_at(time.monotonic())
+        heapq.heappush(self._heaps[lane], (ready_at, next(self._seq), chat_id, chat.version))
+
+    def _pick(self, now: float):
+        """
+        Следующее сообщение: сначала готовые к отправке чаты полосы INTERACTIVE, потом BACKGROUND.
+        """
+        for lane in LANES:
+            heap = self._heaps[lane]
+            while heap:
+                ready_at, _, chat_id, version = heap[0]
+                chat = self._chats.get(chat_id)
+                if chat is None or chat.version != version or chat.busy or not chat.lanes[lane]:
+                    heapq.heappop(heap)
+                    continue
+                if ready_at > now:
+                    break
+                heapq.heappop(heap)
+                chat.busy = True
+                chat.take(now)
+                return chat_id, chat, chat.lanes[lane].popleft()
+        return None
+
+    def _next_timeout(self, now: float) -> float | None:
+        tops = [heap[0][0] for heap in self._heaps if heap]
+        return max(0.0, min(tops) - now) if tops else None
+
+    def _prune(self, now: float):
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        for chat_id in [cid for cid, chat in self._chats.items() if chat.idle(now)]:
+            del self._chats[chat_id]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            picked = self._pick(now)
+            if picked is None:
+                self._prune(now)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._next_timeout(now))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            chat_id, chat, item = picked
+            await self._slots.acquire()
+            await self.limiter.acquire_async()
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            task = asyncio.create_task(self._deliver(chat_id, chat, item))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def _retry(self, chat: _Chat, item: _Outgoing, delay: float) -> bool:
+        """
+        Возвращает сообщение в начало очереди чата с паузой delay; False — попытки кончились.
+        """
+        item.attempts += 1
+        if item.attempts > self.retries:
+            return False
+        chat.blocked_until = max(chat.blocked_until, time.monotonic() + delay)
+        chat.lanes[item.lane].appendleft(item)
+        self.retried += 1
+        return True
+
+    async def _deliver(self, chat_id: int, chat: _Chat, item: _Outgoing):
+        error = None
+        method = getattr(item.call, "__name__", "call")
+        started = time.perf_counter()
+        try:
+            if item.future.done():
+                return  # ожидающий отменил отправку
+            try:
+                result = await item.call(chat_id=chat_id, **item.kwargs)
+            finally:
+                TG_SEND_SECONDS.observe(time.perf_counter() - started, method)
+        except RetryAfter as e:
+            self.retry_after += 1
+            TG_RETRY_AFTER.inc()
+            delay = float(e.retry_after)
+            # Telegram не говорит, чей лимит превышен, поэтому притормаживаем всю отправку
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            logger.warning(f"Telegram RetryAfter {delay:.0f} с (чат {chat_id}), очередь: {self.depth()}")
+            if not self._retry(chat, item, delay):
+                error = e
+        except (BadRequest, Forbidden) as e:
+            error = e
+        except TimedOut as e:
+            # ответа не дождались, но сообщение могло быть доставлено: send_* считаем неудачей
+            # без повтора (тендер подписки дошлёт следующий цикл опроса — deliver_new_tenders
+            # не сдвигает last_ts за неотправленные), идемпотентные вызовы повторяем
+            if (method.startswith(NON_IDEMPOTENT_PREFIX)
+                    or not self._retry(chat, item, min(30.0, 2.0 ** item.attempts))):
+                error = e
+        except NetworkError as e:
+            if not self._retry(chat, item, min(30.0, 2.0 ** item.attempts)):
+                error = e
+        except Exception as e:
+            error = e
+        else:
+            self.sent += 1
+            waited = time.monotonic() - item.enqueued_at
+            self.total_queue_wait += waited
+            TG_QUEUE_WAIT.observe(waited, LANE_NAMES[item.lane])
+            if not item.future.done():
+                item.future.set_result(result)
+        finally:
+            if error is not None:
+                self.failed += 1
+                TG_SEND_FAILED.inc(method)
+                logger.warning(f"Не удалось отправить сообщение в чат {chat_id}: {error}")
+                if not item.future.done():
+                    item.future.set_exception(error)
+            chat.busy = False
+            self._slots.release()
+            self._schedule(chat_id, chat)
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "queued": {LANE_NAMES[lane]: self.depth(lane) for lane in LANES},
+            "in_flight": len(self._inflight),
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retry_after": self.retry_after,
+            "retried": self.retried,
+            "max_depth": self.max_depth,
+            "avg_queue_wait": round(self.total_queue_wait / self.sent, 3) if self.sent else 0.0,
+        }
+
+    async def shutdown(self):
+        tasks = [t for t in (self._task, *self._inflight) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for chat in self._chats.values():
+            for lane in chat.lanes:
+                for item in lane:
+                    if not item.future.done():
+                        item.future.cancel()
+        self._chats.clear()
+        self._heaps = tuple([] for _ in LANES)
+        self._task = None
+
+
+outbound = OutboundDispatcher()
@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from config import DETAIL_CACHE_SIZE, DETAIL_CACHE_TTL, DETAIL_CACHE_PERSIST
+from database import get_connection
+
+
+class TenderCache:
+    """
+    Кэш детальных моделей тендеров (/tenders/get) по _id.
+
+    - первый уровень — LRU в памяти, не больше max_size записей;
+    - второй (опционально) — таблица tender_cache в SQLite, переживает перезапуск;
+    - у каждой записи свой срок жизни: не дольше ttl и не дольше окончания приёма заявок.
+    """
+
+    def __init__(self, max_size: int, ttl: float, persist: bool = False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+        self._items: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, tender_id: str) -> dict | None:
+        """
+        Возвращает копию закэшированной детали или None.
+        """
+        now = time.time()
+        with self._lock:
+            item = self._items.get(tender_id)
+            if item is not None:
+                expires_at, detail = item
+                if expires_at > now:
+                    self._items.move_to_end(tender_id)
+                    self.hits += 1
+                    return dict(detail)
+                del self._items[tender_id]
+        if self.persist:
+            with get_connection() as conn:
+                row = conn.execute(
+                    "SELECT payload, expires_at FROM tender_cache WHERE tender_id = ? AND expires_at > ?",
+                    (tender_id, now)
+                ).fetchone()
+            if row:
+                detail = json.loads(row[0])
+                self._remember(tender_id, detail, row[1])
+                with self._lock:
+                    self.db_hits += 1
+                return dict(detail)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, tender_id: str, detail: dict, ttl: float | None = None):
+        """
+        Сохраняет деталь. Срок жизни — ttl (по умолчанию общий), но не дольше
+        окончания приёма заявок: после него тендер в выгрузки уже не попадает.
+        """
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        close_ts = detail.get("submissionCloseDateTime") or detail.get("submissionCloseDate")
+        if close_ts:
+            expires_at = min(expires_at, close_ts / 1000)
+        if expires_at <= time.time():
+            return
+        self._remember(tender_id, detail, expires_at)
+        if self.persist:
+            with get_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tender_cache (tender_id, payload, expires_at) VALUES (?, ?, ?)",
+                    (tender_id, json.dumps(detail, ensure_ascii=False), expires_at)
+                )
+                conn.commit()
+
+    def _remember(self, tender_id: str, detail: dict, expires_at: float):
+        with self._lock:
+            self._items[tender_id] = (expires_at, detail)
+            self._items.move_to_end(tender_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """
+        Удаляет просроченные записи из SQLite. Возвращает число удалённых строк.
+        """
+        if not self.persist:
+            return 0
+        with get_connection() as conn:
+            cur = conn.execute("DELETE FROM tender_cache WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            return cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.db_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Общий кэш деталей для выгрузок в Excel, сообщениями и рассылки по подпискам.
+detail_cache = TenderCache(DETAIL_CACHE_SIZE, DETAIL_CACHE_TTL, DETAIL_CACHE_PERSIST)
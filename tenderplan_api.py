@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+import weakref
+import httpx
+from config import (
+    TOKEN, API_BASE_URL, API_VERIFY_SSL,
+    API_CONNECT_TIMEOUT, API_READ_TIMEOUT,
+    API_MAX_CONNECTIONS, API_MAX_KEEPALIVE,
+)
+from rate_limiter import api_limiter
+from metrics import API_REQUEST_SECONDS, API_RESPONSES, API_RATE_LIMITED, API_LIMITER_WAIT
+from profiling import count_api_call
+from tender_cache import detail_cache
+from concurrency import AdaptiveConcurrency, detail_concurrency
+from resilience import call_with_retries
+
+logger = logging.getLogger(__name__)
+
+
+class TenderplanClient:
+    """
+    Асинхронный клиент Tenderplan API.
+    Держит пул keep-alive соединений, поэтому обработчики бота и экспортёры
+    не блокируют event loop и не открывают новое TCP/TLS-соединение на каждый запрос.
+    """
+
+    def __init__(self, token: str | None = TOKEN, base_url: str = API_BASE_URL):
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={
+                'Authorization': f'Bearer {token}',
+                'Accept': 'application/json',
+                'Content-Type': 'application/json',
+            },
+            timeout=httpx.Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=API_MAX_CONNECTIONS,
+                max_keepalive_connections=API_MAX_KEEPALIVE,
+            ),
+            verify=API_VERIFY_SSL,
+        )
+
+    async def get(self, path: str, params: dict | None = None,
+                  concurrency: AdaptiveConcurrency | None = None):
+        """
+        GET-запрос к API с общей политикой повторов и предохранителем эндпоинта (см. resilience):
+        429 (с учётом Retry-After), 5xx и сетевые ошибки повторяются с экспоненциальной паузой.
+        Бросает httpx.HTTPStatusError, если повторы не помогли или ответ — прочий 4xx,
+        и resilience.CircuitOpenError, пока API недоступен.
+        Каждая попытка занимает место в concurrency, если он задан.
+        """
+        async def attempt():
+            if concurrency is None:
+                return await self._get_once(path, params)
+            async with concurrency.slot():
+                return await self._get_once(path, params)
+
+        return await call_with_retries(path, attempt)
+
+    async def _get_once(self, path: str, params: dict | None):
+        """
+        Одна попытка запроса; проходит через общий лимитер квоты.
+        """
+        API_LIMITER_WAIT.observe(await api_limiter.acquire_async())
+        count_api_call()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            resp = await self._http.get(path, params=params)
+            status = str(resp.status_code)
+        finally:
+            API_REQUEST_SECONDS.observe(time.perf_counter() - started, path)
+            API_RESPONSES.inc(path, status)
+        if resp.status_code == 429:
+            API_RATE_LIMITED.inc(path)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def get_tenders_page(self, key_id: str, page: int, size: int, **extra) -> list[dict]:
+        """
+        Одна страница превью /tenders/v2/getlist (только статус «Приём заявок»).
+        """
+        params = {
+            'type': 0,
+            'id': key_id,
+            'statuses': [1],
+            'page': page,
+            'size': size,
+        }
+        params.update(extra)
+        data = await self.get("/tenders/v2/getlist", params=params)
+        return data.get('tenders', [])
+
+    async def get_tender(self, tender_id: str, use_cache: bool = True) -> dict:
+        """
+        Детальная модель тендера /tenders/get.
+        Сначала смотрит в общий кэш деталей; возвращает копию, которую можно дополнять.
+        Число одновременных запросов ограничивает общий адаптивный предел detail_concurrency.
+        """
+        if use_cache:
+            cached = detail_cache.get(tender_id)
+            if cached is not None:
+                return cached
+        detail = await self.get("/tenders/get", params={'id': tender_id}, concurrency=detail_concurrency) or {}
+        if detail:
+            detail_cache.put(tender_id, detail)
+        return dict(detail)
+
+    async def get_keys(self) -> list[dict]:
+        """
+        Список ключей пользователя Tenderplan /keys/getall.
+        """
+        data = await self.get("/keys/getall")
+        return data if isinstance(data, list) else data.get("keys", []) or data.get("data", [])
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+# свой клиент у каждого event loop: пул соединений httpx привязан к циклу, и клиент
+# другого, ещё работающего цикла нельзя ни подменить, ни закрыть отсюда
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TenderplanClient]" = weakref.WeakKeyDictionary()
+
+
+def get_client() -> TenderplanClient:
+    """
+    Возвращает общий клиент для текущего event loop, при первом вызове в цикле — создаёт его.
+    Клиент, который не закрыли через close_client до закрытия его цикла, штатно закрыть
+    уже нельзя: он забывается, и его сокеты закрывает сборщик мусора.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        for old in [old for old in _clients if old.is_closed()]:
+            del _clients[old]
+        client = _clients[loop] = TenderplanClient()
+    return client
+
+
+async def close_client():
+    """
+    Закрывает клиент текущего event loop.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
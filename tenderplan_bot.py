@@ -1,33 +1,54 @@
 from __future__ import annotations
+import html
 import logging
 import os
 from telegram import MenuButtonCommands
 from telegram.request import HTTPXRequest
 from telegram import BotCommand
 import asyncio
-import requests
-from telegram.error import RetryAfter
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes,
     ConversationHandler, filters,)
 import time
-from messages_exporter import export_messages
-from Parser import generate_report 
-from messages_exporter import format_tender_message, fetch_tender_detail
-from config import BOT_TOKEN
-from config import TOKEN
-from database import get_connection
-from datetime import datetime
+import weakref
+from collections import deque
+from contextlib import aclosing
+from functools import partial
+from messages_exporter import stream_messages, MessagePacker
+from report_jobs import report_jobs, ReportJob, STATE_LABELS, QUEUED, RUNNING, DONE, FAILED
+from messages_exporter import format_tender_message, message_detail, load_attachments, detail_usage, pack_tender_messages
+from messages_exporter import tender_close_ts
+from config import BOT_TOKEN, POLL_INTERVAL, POLL_CONCURRENCY, DB_MAINTENANCE_HOUR, DIGEST_TEXT_LIMIT, ADMIN_IDS
+from config import MESSAGE_STREAM_BUFFER
+import profiling
+from tenderplan_api import get_client, close_client
+from rate_limiter import api_limiter
+from tender_cache import detail_cache
+from concurrency import detail_concurrency
+from resilience import CircuitOpenError, breaker_stats
+from telegram_dispatcher import outbound, INTERACTIVE, BACKGROUND
+from init_db import init_db
+from database import get_connection, close_connections
+from db_maintenance import run_maintenance
+from sent_filter import sent_filter
+from attachment_store import attachment_store, attachment_rows
+from pagination import iter_previews
+from metrics import POLL_CYCLE_SECONDS, POLL_KEY_TENDERS, POLL_KEY_LAST_TENDERS, start_metrics_server, stop_metrics_server
+from digests import (
+    INSTANT, HOURLY, DAILY, MODE_LABELS, digest_row, due_digests, load_digest, clear_digest,
+    get_delivery_modes, set_delivery_mode, set_digest_hour,
+)
+from Parser import build_workbook
+from datetime import datetime, time as dtime
 
 # состояния разговора
 ASK_EXISTING, ENTER_KEY, ASK_MORE, ADDING_KEY, DELETING_KEY = range(5)
 
-API_URL = "https://tenderplan.ru/api"
-
-
 # Логирование
 logging.basicConfig(level=logging.INFO)
+# httpx пишет в INFO каждый запрос к API — это тысячи строк на выгрузку
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
@@ -96,27 +117,120 @@ def get_active_key(user_id: int) -> str | None:
 def was_tender_sent(user_id: int, tender_id: str) -> bool:
     """
     Проверяет, был ли уже отправлен данный тендер пользователю.
+    Пары, которых точно нет в фильтре Блума, в базе не проверяются.
     """
+    if not sent_filter.might_contain(user_id, tender_id):
+        return False
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute(
             "SELECT 1 FROM sent_tenders WHERE tg_user_id = ? AND tender_id = ?",
             (user_id, tender_id)
         )
-        return cur.fetchone() is not None
+        sent = cur.fetchone() is not None
+    if not sent:
+        sent_filter.false_positives += 1
+    return sent
 
 
-def mark_tender_as_sent(user_id: int, tender_id: str):
+def mark_tender_as_sent(user_id: int, tender_id: str, close_ts: int | None = None):
     """
     Отмечает тендер как отправленный пользователю,
-    чтобы избежать повторной рассылки.
+    чтобы избежать повторной рассылки. close_ts — окончание приёма заявок (мс),
+    после него запись со временем удаляется (db_maintenance).
     """
     with get_connection() as conn:
         conn.execute(
-            "INSERT OR IGNORE INTO sent_tenders (tg_user_id, tender_id) VALUES (?, ?)",
-            (user_id, tender_id)
+            "INSERT OR IGNORE INTO sent_tenders (tg_user_id, tender_id, close_ts) VALUES (?, ?, ?)",
+            (user_id, tender_id, close_ts)
         )
         conn.commit()
+    sent_filter.add(user_id, tender_id)
+
+
+# SQLite ограничивает число параметров запроса (999 в старых сборках)
+SQL_PARAMS_CHUNK = 900
+
+
+def get_sent_pairs(user_ids: list[int], tender_ids: list[str]) -> set[tuple[int, str]]:
+    """
+    Какие из тендеров tender_ids уже отправлены каким из пользователей user_ids.
+    Один запрос на всю пачку (по частям, если пар id больше SQL_PARAMS_CHUNK) вместо
+    was_tender_sent на каждую пару. Тендеры, которых ни у одного пользователя
+    нет в фильтре Блума, в запрос не попадают.
+    """
+    candidates = {
+        (user_id, tid)
+        for tid in dict.fromkeys(tender_ids)
+        for user_id in dict.fromkeys(user_ids)
+        if sent_filter.might_contain(user_id, tid)
+    }
+    sent: set[tuple[int, str]] = set()
+    if not candidates:
+        return sent
+    user_ids = list(dict.fromkeys(user_id for user_id, _ in candidates))
+    tender_ids = list(dict.fromkeys(tid for _, tid in candidates))
+    # в один запрос идут оба списка: пользователей — не больше половины лимита,
+    # тендеров — сколько осталось
+    user_step = min(len(user_ids), SQL_PARAMS_CHUNK // 2)
+    with get_connection() as conn:
+        for i in range(0, len(user_ids), user_step):
+            users = user_ids[i:i + user_step]
+            users_sql = ",".join("?" * len(users))
+            step = SQL_PARAMS_CHUNK - len(users)
+            for j in range(0, len(tender_ids), step):
+                chunk = tender_ids[j:j + step]
+                rows = conn.execute(
+                    f"SELECT tg_user_id, tender_id FROM sent_tenders "
+                    f"WHERE tg_user_id IN ({users_sql}) AND tender_id IN ({','.join('?' * len(chunk))})",
+                    (*users, *chunk)
+                ).fetchall()
+                sent.update(rows)
+    sent_filter.false_positives += len(candidates - sent)
+    return sent
+
+
+def record_deliveries(sent: list[tuple[int, str, int | None]],
+                      attachments: dict[str, tuple[list[dict], int | None]],
+                      states: list[tuple[int, str, int]],
+                      digest: list[tuple] = ()):
+    """
+    Записывает итог рассылки по ключу одной транзакцией:
+    отметки sent_tenders (user_id, tender_id, close_ts), вложения отправленных тендеров
+    {tender_id: (вложения, close_ts)}, новые last_ts подписок и строки digest_queue
+    для подписок в режиме дайджеста.
+    """
+    if not (sent or attachments or states or digest):
+        return
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO digest_queue "
+            "(tg_user_id, tender_key, tender_id, publication_ts, close_ts, detail) VALUES (?, ?, ?, ?, ?, ?)",
+            digest
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO sent_tenders (tg_user_id, tender_id, close_ts) VALUES (?, ?, ?)",
+            sent
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO attachments (tender_id, file_name, url, close_ts) VALUES (?, ?, ?, ?)",
+            [
+                row for tid, (atts, close_ts) in attachments.items()
+                for row in attachment_rows(tid, atts, close_ts)
+            ]
+        )
+        conn.executemany(
+            """
+            INSERT INTO subscription_state (tg_user_id, tender_key, last_ts)
+            VALUES (?, ?, ?)
+            ON CONFLICT(tg_user_id, tender_key) DO UPDATE
+                SET last_ts=excluded.last_ts
+            """,
+            states
+        )
+    # в фильтр — только после коммита, иначе пересборка может его потерять
+    for user_id, tender_id, _ in sent:
+        sent_filter.add(user_id, tender_id)
 
 
 # Обрабатывает завершение выбора ключа через callback_query.
@@ -192,6 +306,10 @@ def unsubscribe_user(user_id: int, key: str):
             "DELETE FROM subscription_state WHERE tg_user_id=? AND tender_key=?",
             (user_id, key)
         )
+        cursor.execute(
+            "DELETE FROM digest_queue WHERE tg_user_id=? AND tender_key=?",
+            (user_id, key)
+        )
         conn.commit()
 
 
@@ -222,11 +340,6 @@ def is_subscribed(user_id: int, key: str) -> bool:
     return exists
 
 
-# Возвращает словарь HTTP-заголовков с авторизацией для API-запросов.
-def get_headers():
-    return {"Authorization": f"Bearer {TOKEN}", "Accept": "application/json"}
-
-
 # --- Команда /ключи — вывод сохранённых в context.user_data['my_keys'] ключей ---
 async def keys_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_keys = get_user_keys(update.effective_user.id)
@@ -290,6 +403,7 @@ async def export_choice_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     kb = InlineKeyboardMarkup([
         [InlineKeyboardButton("📊 В Excel", callback_data="export_excel")],
         [InlineKeyboardButton("💬 Сообщениями", callback_data="export_msgs")],
+        [InlineKeyboardButton("🗂 Компактно", callback_data="export_msgs_compact")],
         [InlineKeyboardButton("❌ Отмена",        callback_data="cancel_export")]
     ])
     if query:
@@ -298,45 +412,116 @@ async def export_choice_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Выберите формат выгрузки тендеров:", reply_markup=kb)
 
 
+class SendWindow:
+    """
+    Сообщения выгрузки, отданные в очередь отправки и ещё не доставленные.
+    Их не больше MESSAGE_STREAM_BUFFER: дальше add() ждёт самое старое, поэтому темп
+    Telegram доходит через stream_messages до загрузки деталей и страниц.
+    """
+
+    def __init__(self, limit: int = MESSAGE_STREAM_BUFFER):
+        self.limit = limit
+        self.delivered = 0
+        self._pending: deque[tuple[asyncio.Future, int]] = deque()
+
+    async def add(self, future: asyncio.Future, tenders: int = 1):
+        self._pending.append((future, tenders))
+        if len(self._pending) >= self.limit:
+            await self._settle_oldest()
+
+    async def _settle_oldest(self):
+        future, tenders = self._pending.popleft()
+        try:
+            await future
+        except Exception:
+            return
+        self.delivered += tenders
+
+    async def finish(self) -> int:
+        """
+        Дожидается всех отправок; возвращает число доставленных тендеров.
+        """
+        while self._pending:
+            await self._settle_oldest()
+        return self.delivered
+
+
+async def send_tender_messages(context, user_id: int, stream, window: SendWindow):
+    """
+    Отправляет каждый тендер отдельным сообщением, как только оно готово.
+    """
+    async for tid, text, atts, close_ts in stream:
+        # собираем кнопку, если есть вложения или они ещё не загружались (None)
+        kb = None
+        if atts or atts is None:
+            kb = InlineKeyboardMarkup([[
+                InlineKeyboardButton("📎 Документы", callback_data=f"show_atts:{tid}")
+            ]])
+        # документы — в общее хранилище для кнопок до отправки, чтобы кнопка сразу работала
+        if atts:
+            attachment_store.put(tid, atts, close_ts)
+        # темп и повтор после flood-контроля — на стороне очереди отправки
+        await window.add(outbound.enqueue(
+            user_id, context.bot.send_message, INTERACTIVE,
+            text=text,
+            parse_mode="HTML",
+            disable_web_page_preview=True,
+            reply_markup=kb
+        ))
+
+
+async def send_compact_messages(context, user_id: int, stream, window: SendWindow):
+    """
+    Компактный режим: тендеры упаковываются в сообщения до 4096 символов по мере готовности,
+    под каждым — кнопки «📎 N» для тендеров с документами.
+    """
+    # окончание приёма заявок тендеров текущей пачки — срок хранения их документов
+    close_by_tid: dict[str, int | None] = {}
+
+    async def send_pack(text, items):
+        buttons = []
+        for n, tid, atts in items:
+            if atts or atts is None:
+                buttons.append(InlineKeyboardButton(f"📎 {n}", callback_data=f"show_atts:{tid}"))
+        kb = InlineKeyboardMarkup([buttons[i:i + 5] for i in range(0, len(buttons), 5)]) if buttons else None
+        # документы пачки — одной транзакцией
+        closes = {tid: close_by_tid.pop(tid, None) for _, tid, _ in items}
+        attachment_store.put_many([(tid, atts, closes[tid]) for _, tid, atts in items if atts])
+        await window.add(outbound.enqueue(
+            user_id, context.bot.send_message, INTERACTIVE,
+            text=text,
+            parse_mode="HTML",
+            disable_web_page_preview=True,
+            reply_markup=kb
+        ), tenders=len(items))
+
+    packer = MessagePacker()
+    async for tid, text, atts, close_ts in stream:
+        close_by_tid[tid] = close_ts
+        if (pack := packer.add(tid, text, atts)):
+            await send_pack(*pack)
+    if (pack := packer.flush()):
+        await send_pack(*pack)
+
+
 # --- Экспорт тендеров в сообщения ---
 async def export_to_messages_cb(update, context):
     q = update.callback_query
     await q.answer()
     user_id = q.from_user.id
     key_id  = get_active_key(user_id)
-    msgs = export_messages(key_id)
-    sent_count = 0
-    for tid, text, atts in msgs:
-        # собираем кнопку, если есть вложения
-        kb = None
-        if atts:
-            # сохраняем в user_data для callback
-            context.user_data[f"atts_{tid}"] = atts
-            kb = InlineKeyboardMarkup([[
-                InlineKeyboardButton("📎 Документы", callback_data=f"show_atts:{tid}")
-            ]])
-         # Пытаемся отправить, ловим flood‑контроль
-        try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=text,
-                parse_mode="HTML",
-                disable_web_page_preview=True,
-                reply_markup=kb
-            )
-        except RetryAfter as e:
-            # Telegram говорит подождать e.retry_after секунд
-            await asyncio.sleep(e.retry_after)
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=text,
-                parse_mode="HTML",
-                disable_web_page_preview=True,
-                reply_markup=kb
-            )
-        sent_count += 1
-        # И небольшая пауза между сообщениями
-        await asyncio.sleep(0.1)  # 100 мс
+    # тендеры уходят в чат по мере загрузки, а не после всей выгрузки
+    window = SendWindow()
+    send = send_compact_messages if q.data == "export_msgs_compact" else send_tender_messages
+    failed = None
+    try:
+        async with aclosing(stream_messages(key_id)) as stream:
+            await send(context, user_id, stream, window)
+    except Exception as e:
+        logger.exception(f"Выгрузка сообщениями по ключу {key_id} прервана")
+        failed = e
+    sent_count = await window.finish()
+    detail_usage.delivered += sent_count
     # после всех — финальная клавиатура
     kb = [
         [InlineKeyboardButton("📊 В Excel",       callback_data="export_excel")],
@@ -347,34 +532,50 @@ async def export_to_messages_cb(update, context):
     subscribed = is_subscribed(user_id, key_id)
     if not subscribed:
         kb.insert(0, [InlineKeyboardButton("🔔 Подписаться на новые", callback_data="subscribe")])
-    await context.bot.send_message(
-    chat_id=user_id,
-    text=f"✅ Все тендеры отправлены в чат.\nОтправлено тендеров: {sent_count}\nЧто дальше?",
+    if failed is None:
+        text = f"✅ Все тендеры отправлены в чат.\nОтправлено тендеров: {sent_count}\nЧто дальше?"
+    else:
+        text = (f"⚠️ Выгрузка прервана ошибкой при загрузке тендеров.\n"
+                f"Отправлено тендеров: {sent_count}\nЧто дальше?")
+    await outbound.send(
+    user_id, context.bot.send_message,
+    text=text,
     reply_markup=InlineKeyboardMarkup(kb)
     )
     return ConversationHandler.END
 
 # --- Подкрепление к сообщениям ссылок на документы ---
+# Обработчик кнопок «📎 Документы» выгрузки (show_atts:) и подписок (show_sub_atts:)
 async def show_attachments_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query; await q.answer()
     _, tid = q.data.split(":", 1)
-    docs   = context.user_data.get(f"atts_{tid}", [])
+    docs   = attachment_store.get(tid)  # [(file_name, url), ...]
+    if docs is None:
+        # сообщение собрано из превью — вложения загружаются только сейчас
+        try:
+            atts, close_ts = await load_attachments(tid)
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить документы тендера {tid}: {e}")
+            return await outbound.send(
+                q.message.chat_id, context.bot.send_message, INTERACTIVE,
+                text="⚠️ Не удалось загрузить документы, попробуйте позже.",
+                reply_to_message_id=q.message.message_id
+            )
+        attachment_store.put(tid, atts, close_ts)
+        docs = attachment_store.get(tid) or []
 
     if not docs:
-        return await context.bot.send_message(
-            chat_id=q.message.chat_id,
+        return await outbound.send(
+            q.message.chat_id, context.bot.send_message, INTERACTIVE,
             text="📎 Документов нет.",
             reply_to_message_id=q.message.message_id
         )
 
-    lines = [
-        f'— <a href="{a["href"]}">{a.get("displayName","Файл")}</a>'
-        for a in docs
-    ]
+    lines = [f'— <a href="{html.escape(url)}">{html.escape(name)}</a>' for name, url in docs]
     text = "<b>📎 Документы:</b>\n" + "\n".join(lines)
     # Отправляем документы именно в ответ на сообщение с тендером
-    await context.bot.send_message(
-        chat_id=q.message.chat_id,
+    await outbound.send(
+        q.message.chat_id, context.bot.send_message, INTERACTIVE,
         text=text,
         parse_mode="HTML",
         disable_web_page_preview=True,
@@ -409,6 +610,7 @@ async def select_key_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     kb = InlineKeyboardMarkup([
         [InlineKeyboardButton("📊 В Excel",    callback_data="export_excel")],
         [InlineKeyboardButton("💬 Сообщениями", callback_data="export_msgs")],
+        [InlineKeyboardButton("🗂 Компактно",   callback_data="export_msgs_compact")],
         [InlineKeyboardButton("❌ Отмена",       callback_data="cancel_export")],
     ])
     await query.edit_message_text(
@@ -510,6 +712,7 @@ async def choose_export_format_cb(update: Update, context: ContextTypes.DEFAULT_
         reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton("📥 Excel", callback_data="export_excel")],
             [InlineKeyboardButton("📩 Сообщениями", callback_data="export_msgs")],
+            [InlineKeyboardButton("🗂 Компактно", callback_data="export_msgs_compact")],
             [InlineKeyboardButton("🔙 Назад", callback_data="go_start")]
         ])
     )
@@ -557,6 +760,10 @@ async def delete_key_confirm_cb(update: Update, context: ContextTypes.DEFAULT_TY
             "DELETE FROM subscription_state WHERE tg_user_id=? AND tender_key=?",
             (user_id, key_id)
         )
+        cursor.execute(
+            "DELETE FROM digest_queue WHERE tg_user_id=? AND tender_key=?",
+            (user_id, key_id)
+        )
         conn.commit()
     await q.edit_message_text(f"✅ Ключ *{key_id}* удалён.", parse_mode="Markdown")
     return await manage_keys_cb(update, context)
@@ -577,10 +784,7 @@ async def enter_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     # пытаемся найти ID по имени среди ключей в TenderPlan
     try:
-        resp = requests.get(f"{API_URL}/keys/getall", headers=get_headers())
-        resp.raise_for_status()
-        data = resp.json()
-        remote_keys = data if isinstance(data, list) else data.get("keys", []) or data.get("data", [])
+        remote_keys = await get_client().get_keys()
         match = [k for k in remote_keys if k["name"].lower() == text.lower()]
         if len(match) == 1:
             key_id = match[0]["_id"]
@@ -660,6 +864,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/keys — Просмотреть список ваших ключей, добавить новый или выбрать активный\n"
         "/export — Выгрузить список тендеров по активному ключу в удобном формате\n"
         "/subscriptions — Показать на какие ключи вы подписаны для уведомлений о новых тендерах\n"
+        "/reports — Показать состояние ваших отчётов в Excel\n"
+        "/digest — Как присылать новые тендеры по подпискам: сразу или дайджестом\n"
         "/help — Показать это сообщение с описанием команд\n")
 
 
@@ -676,40 +882,47 @@ async def export_tenders(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "У вас не выбран активный ключ. Выберите его командой /keys или добавьте новый."
         )
 
-    # ————— Скачиваем превью и берём max(publicationDate) —————
-    resp = requests.get(
-        f"{API_URL}/tenders/getlist",
-        params={'key': key_id, 'page': 0, 'size': 1000, 'status': 1},
-        headers=get_headers(),
-        verify=False
-    )
-    resp.raise_for_status()
-    previews = resp.json().get('tenders', [])
-    #timestamps = [t.get('publicationDate', 0) for t in previews]
-    #max_pub = max(timestamps) if timestamps else int(time.time() * 1000)
-    #update_subscription_state(user_id, key_id, max_pub)
-
-    # ————— Генерируем отчёт —————
-    notice = await message.reply_text("Генерирую отчёт…⏳")
-    try:
-        result = generate_report(key_id)
-        report_path = result[0] if isinstance(result, tuple) else result
-    except Exception as e:
-        await message.reply_text(f"❌ Не удалось создать отчёт: {e}")
-        return ConversationHandler.END 
+    # ————— Ставим отчёт в очередь —————
+    # генерация идёт в фоне, обработчик сразу освобождается
+    notice = await message.reply_text("Отчёт поставлен в очередь…⏳")
+    job = report_jobs.submit(key_id, user_id, partial(on_report_job, context.bot, notice))
+    if job.state == RUNNING:
+        # такой же отчёт уже строится по чужому запросу — ждём его
+        await notice.edit_text("Генерирую отчёт…⏳")
+    elif job.state == QUEUED and (ahead := report_jobs.position(job)):
+        await notice.edit_text(f"Отчёт поставлен в очередь, перед ним заданий: {ahead}…⏳")
+    return ConversationHandler.END
+
+
+async def on_report_job(bot, notice, job: ReportJob):
+    """
+    Слушатель задания на отчёт: обновляет сообщение о статусе и отправляет готовый файл.
+    Задание может быть общим для нескольких чатов, поэтому адресат берётся из notice.
+    """
+    if job.state == RUNNING:
+        await notice.edit_text("Генерирую отчёт…⏳")
+        return
+    if job.state == FAILED:
+        await notice.edit_text(f"❌ Не удалось создать отчёт: {job.error}")
+        return
+    if job.state != DONE:
+        return
     await notice.delete()
+    user_id, key_id = notice.chat_id, job.key_id
     try:
-        with open(report_path, "rb") as doc:
-            await context.bot.send_document(
-                chat_id=user_id,
-                document=doc,
-                filename=os.path.basename(report_path)
-            )
+        # отчёт собран в памяти и уходит в Telegram без временного файла;
+        # следующим получателям отправляем уже загруженный файл по file_id
+        sent = await outbound.send(
+            user_id, bot.send_document,
+            document=job.file_id or job.result,
+            filename=job.filename,
+            caption=(f"⚠️ Tenderplan API не отдал подробности {job.missing} тендеров — "
+                     f"по ним в отчёте только краткие данные." if job.missing else None)
+        )
+        if job.file_id is None and sent.document:
+            job.file_id = sent.document.file_id
     except Exception as e:
         logger.exception("Ошибка при отправке отчёта")
-    finally:
-        if os.path.exists(report_path):
-            os.remove(report_path)
 
     # ————— Предлагаем следующие действия —————
     subscribed = is_subscribed(user_id, key_id)
@@ -722,11 +935,55 @@ async def export_tenders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     buttons.append([InlineKeyboardButton("🔑 Выбрать другой ключ", callback_data="change_key")])
     buttons.append([InlineKeyboardButton("↩️ В начало", callback_data="go_start")])
 
-    await message.reply_text(
-        "✅ Отчёт готов и отправлен!\n\nЧто будем делать дальше?",
+    await outbound.send(
+        user_id, bot.send_message,
+        text="✅ Отчёт готов и отправлен!\n\nЧто будем делать дальше?",
         reply_markup=InlineKeyboardMarkup(buttons)
     )
-    return ConversationHandler.END
+
+
+# --- Команда /reports — состояние заданий на отчёты ---
+async def show_report_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    jobs = report_jobs.user_jobs(update.effective_user.id)
+    if not jobs:
+        return await update.message.reply_text("📭 Заданий на отчёты пока нет.")
+    lines = []
+    for job in jobs:
+        line = f"#{job.id} `{job.key_id}` — {STATE_LABELS[job.state]}"
+        if job.duration is not None:
+            line += f", {job.duration:.0f} с"
+        lines.append(line)
+    await update.message.reply_text("📊 *Ваши отчёты:*\n\n" + "\n".join(lines), parse_mode="Markdown")
+
+
+# --- Команда /profile — cProfile одного прогона отчёта или выгрузки (только для ADMIN_IDS) ---
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        return
+    if context.args and context.args[0] == "last":
+        path = profiling.last_dump
+        if not path or not os.path.exists(path):
+            return await update.message.reply_text("📭 Дампов cProfile пока нет.")
+        summary = await asyncio.to_thread(profiling.dump_summary, path)
+        with open(path, "rb") as f:
+            await outbound.send(
+                user_id, context.bot.send_document,
+                document=f.read(),
+                filename=os.path.basename(path),
+            )
+        # верх таблицы pstats — самое полезное, целиком в сообщение она не влезает
+        await outbound.send(
+            user_id, context.bot.send_message,
+            text=f"<pre>{html.escape(summary[:3500])}</pre>",
+            parse_mode="HTML"
+        )
+        return
+    profiling.arm_cprofile()
+    await update.message.reply_text(
+        "🔬 Следующий отчёт или выгрузка сообщениями будет записан в cProfile.\n"
+        "Результат: /profile last"
+    )
 
 # --- Команда подписки ---
 async def subscribe_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -815,8 +1072,8 @@ async def go_start_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_keys:
         full_name = q.from_user.full_name or "пользователь"
         await q.edit_message_text(f"👋 Добро пожаловать, {full_name}!")
-        await context.bot.send_message(
-            chat_id=user_id,
+        await outbound.send(
+            user_id, context.bot.send_message, INTERACTIVE,
             text="У вас ещё нет ключа — добавьте его из системы:",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("🔄 Добавить", callback_data="has_existing")]
@@ -866,169 +1123,382 @@ async def go_start_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ASK_EXISTING
     
 
+def get_subscription_groups() -> dict[str, dict[int, tuple[int, str, str]]]:
+    """
+    Группирует подписки по tender_key: {tender_key: {tg_user_id: (last_ts, имя ключа, режим)}}.
+    Позволяет опрашивать API один раз на ключ, сколько бы пользователей на него ни подписалось.
+    Имя ключа и режим доставки берутся тем же запросом, чтобы при рассылке
+    не читать их на каждый тендер.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT s.tender_key, s.tg_user_id, COALESCE(st.last_ts, 0), k.tender_name, s.delivery_mode
+            FROM subscriptions s
+            LEFT JOIN subscription_state st
+                ON st.tg_user_id = s.tg_user_id AND st.tender_key = s.tender_key
+            LEFT JOIN user_keys k
+                ON k.tg_user_id = s.tg_user_id AND k.tender_key = s.tender_key
+            """
+        )
+        rows = cursor.fetchall()
+    groups: dict[str, dict[int, tuple[int, str, str]]] = {}
+    for key, user_id, last_ts, key_name, mode in rows:
+        groups.setdefault(key, {})[user_id] = (last_ts, key_name or key, mode or INSTANT)
+    return groups
+
+
+async def fetch_new_previews(key: str, from_ts: int, now_ts: int) -> tuple[list[dict], bool]:
+    """
+    Загружает превью тендеров по ключу, опубликованных начиная с from_ts,
+    и оставляет только те, приём заявок по которым ещё не закончился.
+    Возвращает (превью, загружена ли выдача целиком): при ошибке — то, что успело загрузиться.
+    Пока API недоступен (предохранитель разомкнут), запрос не отправляется вовсе.
+    """
+    all_new_tenders = []
+    try:
+        # закрытые тендеры не означают конец выдачи — листаем до последней страницы
+        async for page in iter_previews(key, now_ts=now_ts, stop_on_closed=False,
+                                        fromPublicationDateTime=from_ts, publicationDateTime=-1):
+            all_new_tenders.extend(page)
+    except CircuitOpenError as e:
+        print(f"[!] Ключ {key} пропущен: {e}")
+        return all_new_tenders, False
+    except Exception as e:
+        print(f"[!] Ошибка при загрузке тендеров по ключу {key}: {e}")
+        return all_new_tenders, False
+    print(f"[INFO] Ключ {key}: новых открытых тендеров {len(all_new_tenders)}")
+    return all_new_tenders, True
+
+
+class KeyBatch:
+    """
+    Итог рассылки по одному ключу за цикл: что записать в базу одной транзакцией.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.sent: list[tuple[int, str, int | None]] = []
+        self.attachments: dict[str, tuple[list[dict], int | None]] = {}
+        self.states: list[tuple[int, str, int]] = []
+        self.digest: list[tuple] = []
+        # выдача загружена не целиком — last_ts не сдвигаем, чтобы не потерять
+        # недогруженные тендеры; повторы отсекает sent_tenders
+        self.complete = True
+
+    def flush(self):
+        record_deliveries(self.sent, self.attachments, self.states, self.digest)
+        self.sent, self.attachments, self.states, self.digest = [], {}, [], []
+
+
+async def deliver_new_tenders(bot, user_id: int, key: str, last_ts: int, key_name: str,
+                              previews: list[dict], details: dict[str, asyncio.Task],
+                              already_sent: set[tuple[int, str]], batch: KeyBatch,
+                              mode: str = INSTANT, full_details: bool = False):
+    """
+    Рассылает пользователю тендеры ключа, опубликованные после его last_ts и ещё не отправленные.
+    details — общий для всех подписчиков ключа словарь {tender_id: задача загрузки детали},
+    поэтому каждый тендер запрашивается из API не больше одного раза за цикл,
+    даже когда подписчики обслуживаются параллельно.
+    already_sent — пары (user_id, tender_id) из sent_tenders, загруженные одним запросом;
+    отметки об отправке, вложения и новый last_ts копятся в batch и пишутся после рассылки.
+    В режиме дайджеста (mode hourly / daily) тендер не отправляется, а откладывается
+    в digest_queue до ближайшего send_digests.
+    Сообщение собирается из превью, если в нём хватает полей, — вложения тогда загрузит
+    кнопка «📎 Документы»; full_details — всегда запрашивать деталь (нужна для Excel-дайджеста).
+    """
+    user_previews = [
+        t for t in previews
+        if isinstance(t, dict) and t.get('publicationDateTime', 0) >= last_ts
+    ]
+    if not user_previews:
+        print(f"[INFO] Для пользователя {user_id} по ключу {key} новых тендеров нет.")
+        return
+    # сообщения ставятся в фоновую полосу очереди отправки сразу по готовности детали,
+    # отметка «отправлено» — только для тех, что действительно ушли
+    pending: list[tuple[asyncio.Future, str, int | None, int]] = []
+    # publicationDateTime тендеров, которые не удалось обработать или отправить:
+    # граница last_ts не должна уйти дальше них, иначе следующий цикл их не запросит
+    failed_ts: list[int] = []
+    # все нужные детали запрашиваются сразу, до рассылки: их параллельность ограничивает
+    # detail_concurrency, а ниже они только дожидаются по порядку
+    for preview in user_previews:
+        tid = preview.get('_id')
+        if (user_id, tid) not in already_sent and tid not in details:
+            details[tid] = asyncio.create_task(message_detail(preview, full=full_details))
+    for preview in user_previews:
+        published = preview.get('publicationDateTime', 0)
+        try:
+            tid = preview.get('_id')
+            if (user_id, tid) in already_sent:
+                print(f"[SKIP] Тендер {tid} уже был отправлен пользователю {user_id}, пропускаем.")
+                continue
+            detail, atts = await details[tid]
+            text = f"🔑 Подписка по ключу: <b>{key_name}</b>\n\n" + format_tender_message(detail)
+            tid = detail.get('_id', '')
+            if atts:
+                batch.attachments[tid] = (atts, tender_close_ts(detail))
+            if atts or atts is None:
+                kb = InlineKeyboardMarkup([[InlineKeyboardButton("📎 Документы", callback_data=f"show_sub_atts:{tid}")]])
+            else:
+                kb = None
+            if mode != INSTANT:
+                batch.digest.append(digest_row(user_id, key, detail, published, tender_close_ts(detail)))
+                batch.sent.append((user_id, tid, tender_close_ts(detail)))
+                continue
+            future = outbound.enqueue(
+                user_id, bot.send_message, BACKGROUND,
+                text=text,
+                parse_mode="HTML",
+                disable_web_page_preview=True,
+                reply_markup=kb
+            )
+            pending.append((future, tid, tender_close_ts(detail), published))
+        except Exception as e:
+            print(f"[!] Ошибка при обработке тендера: {e}")
+            failed_ts.append(published)
+            continue
+
+    for future, tid, close_ts, published in pending:
+        try:
+            await future
+        except Exception as e:
+            print(f"[!] Ошибка при отправке тендера {tid} пользователю {user_id}: {e}")
+            failed_ts.append(published)
+            continue
+        # ✅ Отмечаем тендер как отправленный
+        batch.sent.append((user_id, tid, close_ts))
+        detail_usage.delivered += 1
+
+    # Обновляем границу только если есть новые тендеры
+    new_max = max(t.get('publicationDateTime', 0) for t in user_previews)
+    if failed_ts:
+        # выборка идёт с fromPublicationDateTime >= last_ts включительно: неотправленные
+        # тендеры придут снова, а уже отправленные с той же датой отсечёт sent_tenders
+        new_max = min(new_max, min(failed_ts))
+        print(f"[DEBUG] Не отправлено тендеров: {len(failed_ts)} — last_ts не дальше {new_max}.")
+    if new_max > last_ts and batch.complete:
+        print(f"Обновляем last_ts с {last_ts} на {new_max} для ключа {key}, пользователь {user_id}")
+        batch.states.append((user_id, key, new_max))
+    elif not batch.complete:
+        print(f"[DEBUG] Выдача по ключу {key} загружена не целиком — last_ts не обновляем.")
+    else:
+        print(f"[DEBUG] new_max ({new_max}) <= last_ts ({last_ts}) — не обновляем.")
+
+
+async def poll_key(bot, key: str, subscribers: dict[int, tuple[int, str, str]], now_ts: int):
+    """
+    Один ключ за цикл: загружает новые превью и раздаёт их всем подписчикам параллельно.
+    База читается один раз до рассылки (уже отправленные пары) и пишется
+    одной транзакцией после неё — даже если рассылка прервалась ошибкой.
+    """
+    from_ts = min(last_ts for last_ts, _, _ in subscribers.values())
+    print(f"Проверяем ключ {key} для {len(subscribers)} подписчиков, from_ts={from_ts}")
+    all_new_tenders, complete = await fetch_new_previews(key, from_ts, now_ts)
+    POLL_KEY_LAST_TENDERS.set(len(all_new_tenders), key)
+    if not all_new_tenders:
+        print(f"[INFO] Для ключа {key} новых тендеров нет.")
+        return
+    POLL_KEY_TENDERS.inc(key, amount=len(all_new_tenders))
+    print(f"Новых тендеров всего: {len(all_new_tenders)}")
+    details: dict[str, asyncio.Task] = {}
+    # дайджест может уйти Excel-файлом, а для него нужна полная деталь
+    full_details = any(mode != INSTANT for _, _, mode in subscribers.values())
+    already_sent = get_sent_pairs(
+        list(subscribers),
+        [t.get('_id') for t in all_new_tenders]
+    )
+    batch = KeyBatch(key)
+    batch.complete = complete
+    try:
+        await asyncio.gather(*(
+            deliver_new_tenders(bot, user_id, key, last_ts, key_name,
+                                all_new_tenders, details, already_sent, batch, mode, full_details)
+            for user_id, (last_ts, key_name, mode) in subscribers.items()
+        ))
+    finally:
+        # рассылка прервана — загрузки деталей, которых уже никто не ждёт, не нужны
+        for task in details.values():
+            task.cancel()
+        batch.flush()
+
+
 # --- Команда проверки и отправки новых тендеров по подписке ---
 async def check_new_tenders(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Опрашивает API один раз на каждый подписанный ключ — начиная с самого раннего
+    last_ts среди его подписчиков — и раздаёт результат всем подписчикам ключа
+    с учётом их собственного last_ts и sent_tenders.
+    Ключи обрабатываются параллельно, не больше POLL_CONCURRENCY одновременно;
+    общую квоту API соблюдает лимитер клиента. Ошибка по одному ключу
+    не прерывает обработку остальных.
+    """
     bot = context.bot
+    started = time.monotonic()
     now_ts = int(datetime.now().timestamp() * 1000)  # текущее время в мс
-    for user_id, key in get_subscriptions():
-        last_ts = get_last_ts(user_id, key)
-        print(f"Проверяем ключ {key} для пользователя {user_id}, last_ts={last_ts}")
-        all_new_tenders = []
-        page = 0
-        size = 50
-        while True:
-            try:
-                resp = requests.get(
-                    f"{API_URL}/tenders/v2/getlist",
-                    params={
-                        'type': 0,
-                        'id': key,
-                        'statuses': [1],
-                        'page': page,
-                        'size': size,
-                        'fromPublicationDateTime': last_ts,
-                        'publicationDateTime': -1
-                    },
-                    headers=get_headers(),
-                    verify=False
-                )
-                resp.raise_for_status()
-                batch = resp.json().get('tenders', [])
-                print(f"[INFO] Ключ {key}, страница {page}, всего тендеров в batch: {len(batch)}")
-                #Оставляем только актуальные (ещё не закончены)
-                new_items = [
-                    t for t in batch
-                    if (t.get("submissionCloseDateTime") or t.get("submissionCloseDate") or 0) > now_ts
-                ]
-                if not new_items and len(batch) < size:
-                    print(f"[INFO] Нет новых тендеров и страницы закончились, выходим.")
-                    # Если новых нет и дальше страницы закончились — выходим
-                    break
-
-                all_new_tenders.extend(new_items)
-                # Если пришло меньше, чем size — значит последняя страница
-                if len(batch) < size:
-                    print(f"[INFO] Последняя страница получена.")
-                    break
-                page += 1
-            except Exception as e:
-                print(f"[!] Ошибка при загрузке тендеров по ключу {key}, страница {page}: {e}")
-                break
-        if not all_new_tenders:
-            print(f"[INFO] Для ключа {key} новых тендеров нет.")
-            continue
-        print(f"Новых тендеров всего: {len(all_new_tenders)}")
-        for preview in all_new_tenders:
+    groups = get_subscription_groups()
+    slots = asyncio.Semaphore(POLL_CONCURRENCY)
+
+    async def guarded(key: str, subscribers: dict[int, int]):
+        async with slots:
             try:
-                tid = preview.get('_id')
-                if was_tender_sent(user_id, tid):
-                    print(f"[SKIP] Тендер {tid} уже был отправлен пользователю {user_id}, пропускаем.")
-                    continue
-                detail = fetch_tender_detail(preview)
-                key_name = get_key_name(user_id, key)
-                text = f"🔑 Подписка по ключу: <b>{key_name}</b>\n\n" + format_tender_message(detail)
-                atts = detail.get('attachments', [])
-                tid = detail.get('_id', '')
-                if atts:
-                    save_attachments(tid, atts)
-                    kb = InlineKeyboardMarkup([[InlineKeyboardButton("📎 Документы", callback_data=f"show_sub_atts:{tid}")]])
-                else:
-                    kb = None
-                try:
-                    await bot.send_message(
-                        chat_id=user_id,
-                        text=text,
-                        parse_mode="HTML",
-                        disable_web_page_preview=True,
-                        reply_markup=kb
-                    )
-                except RetryAfter as e:
-                    await asyncio.sleep(e.retry_after)
-                    await bot.send_message(chat_id=user_id,text=text,
-                                            parse_mode="HTML",
-                                            disable_web_page_preview=True,
-                                            reply_markup=kb)
-                # ✅ Отмечаем тендер как отправленный
-                mark_tender_as_sent(user_id, tid)
-                await asyncio.sleep(0.1)
-            except Exception as e:
-                print(f"[!] Ошибка при обработке тендера: {e}")
-                continue
+                await poll_key(bot, key, subscribers, now_ts)
+            except Exception:
+                logger.exception(f"Ошибка при опросе ключа {key}")
 
-                # Обновляем границу только если есть новые тендеры
-        filtered = [t for t in all_new_tenders if isinstance(t, dict)]
-        if filtered:
-            new_max = max(t.get('publicationDateTime', 0) for t in filtered)
-            if new_max > last_ts:
-                print(f"Обновляем last_ts с {last_ts} на {new_max} для ключа {key}")
-                update_subscription_state(user_id, key, new_max)
-            else:
-                print(f"[DEBUG] new_max ({new_max}) <= last_ts ({last_ts}) — не обновляем.")
-        else:
-            print(f"Нет новых тендеров для ключа {key}, last_ts не обновляем.")
+    await asyncio.gather(*(guarded(key, subs) for key, subs in groups.items()))
 
+    elapsed = time.monotonic() - started
+    POLL_CYCLE_SECONDS.observe(elapsed)
+    logger.info(
+        f"Цикл подписок: ключей {len(groups)}, {elapsed:.1f} с из {POLL_INTERVAL} с; "
+        f"ожидание квоты API: {api_limiter.stats()}; кэш деталей: {detail_cache.stats()}"
+    )
+    logger.info(f"Параллельность запросов деталей: {detail_concurrency.stats()}; "
+                f"предохранители API: {breaker_stats()}")
+    logger.info(f"Фильтр sent_tenders: {sent_filter.stats()}; очередь отправки: {outbound.stats()}")
+    logger.info(f"Детали на доставленный тендер: {detail_usage.stats()}; документы: {attachment_store.stats()}")
+    detail_cache.purge_expired()
+    if elapsed > POLL_INTERVAL:
+        logger.warning(f"Цикл подписок ({elapsed:.0f} с) не уложился в интервал {POLL_INTERVAL} с")
 
-def save_attachments(tender_id: str, attachments: list[dict]):
-    """
-    Сохраняет список вложений (документов) для конкретного тендера в таблицу attachments.
 
-    - tender_id: ID тендера.
-    - attachments: [{"displayName": "Документ.pdf", "href": "https://..."}]
+async def maintain_database(context: ContextTypes.DEFAULT_TYPE):
     """
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        for att in attachments:
-            file_name = att.get("displayName") or att.get("fileName") or "Файл"
-            url = att.get("href") or att.get("url")
-            if url:  # сохраняем только если есть ссылка
-                cursor.execute("""
-                    INSERT OR IGNORE INTO attachments (tender_id, file_name, url)
-                    VALUES (?, ?, ?)
-                """, (tender_id, file_name, url))
-        conn.commit()
+    Ежедневное обслуживание базы: удаление записей по закрытым тендерам, VACUUM,
+    затем пересборка фильтра sent_tenders без удалённых пар.
+    Работает в отдельном потоке, чтобы не блокировать обработчики.
+    """
+    try:
+        await asyncio.to_thread(run_maintenance)
+        await asyncio.to_thread(sent_filter.rebuild)
+    except Exception:
+        logger.exception("Ошибка при обслуживании базы")
 
 
+# дайджесты одного пользователя не отправляются одновременно (job и переключение режима)
+_digest_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
 
-def get_attachments(tender_id: str) -> list[tuple[str, str]]:
-    """
-    Возвращает список вложений (имя файла и URL) для указанного тендера.
 
-    - tender_id: ID тендера.
-    - Возвращает список кортежей (file_name, url).
-    - Если документов нет, возвращает пустой список.
+async def send_digest(bot, user_id: int, key: str, key_name: str):
     """
-    with get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT file_name, url FROM attachments WHERE tender_id=?", (tender_id,))
-        return cursor.fetchall()
+    Отправляет накопленный дайджест подписки одним сгруппированным сообщением
+    (или несколькими по 4096 символов), а если тендеров больше DIGEST_TEXT_LIMIT —
+    Excel-файлом. Тендеры убираются из очереди сразу после отправки своего сообщения,
+    поэтому после сбоя на середине повторная отправка начинается с неотправленных.
+    Дайджесты пользователя отправляются по одному: очередь читается уже под замком.
+    """
+    lock = _digest_locks.get(user_id)
+    if lock is None:
+        lock = _digest_locks[user_id] = asyncio.Lock()
+    async with lock:
+        details = load_digest(user_id, key)
+        if not details:
+            return
+        header = f"🗞 Дайджест по ключу <b>{html.escape(key_name)}</b>: новых тендеров {len(details)}"
+        if len(details) > DIGEST_TEXT_LIMIT:
+            report = await asyncio.get_running_loop().run_in_executor(None, build_workbook, details)
+            await outbound.send(
+                user_id, bot.send_document, BACKGROUND,
+                document=report.getvalue(),
+                filename=report.name,
+                caption=header,
+                parse_mode="HTML"
+            )
+            clear_digest(user_id, key, [d.get('_id', '') for d in details])
+            detail_usage.delivered += len(details)
+            return
+        await outbound.send(user_id, bot.send_message, BACKGROUND, text=header, parse_mode="HTML")
+        msgs = [(d.get('_id', ''), format_tender_message(d), d.get('attachments', [])) for d in details]
+        for text, items in pack_tender_messages(msgs):
+            buttons = [
+                InlineKeyboardButton(f"📎 {n}", callback_data=f"show_sub_atts:{tid}")
+                for n, tid, atts in items if atts
+            ]
+            kb = InlineKeyboardMarkup([buttons[i:i + 5] for i in range(0, len(buttons), 5)]) if buttons else None
+            await outbound.send(
+                user_id, bot.send_message, BACKGROUND,
+                text=text,
+                parse_mode="HTML",
+                disable_web_page_preview=True,
+                reply_markup=kb
+            )
+            clear_digest(user_id, key, [tid for _, tid, _ in items])
+            detail_usage.delivered += len(items)
 
-#Обработчик кнопки "Документы"
-async def show_attachments_sub_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    _, tid = q.data.split(":", 1)
 
-    docs = get_attachments(tid)  # [(file_name, url), ...]
+async def send_digests(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Ежечасный job: отправляет дайджесты подписок в режиме hourly и тех daily,
+    у которых наступил выбранный час (UTC), а также остатки очереди подписок,
+    переключённых на мгновенную доставку (если сразу дослать их не удалось).
+    """
+    hour = time.gmtime().tm_hour
+    due = due_digests(hour)
 
-    if not docs:
-        return await context.bot.send_message(
-            chat_id=q.message.chat_id,
-            text="📎 Документов нет.",
-            reply_to_message_id=q.message.message_id
-        )
+    async def guarded(user_id: int, key: str, key_name: str):
+        try:
+            await send_digest(context.bot, user_id, key, key_name)
+        except Exception:
+            logger.exception(f"Не удалось отправить дайджест по ключу {key} пользователю {user_id}")
 
-    lines = [f'— <a href="{url}">{name}</a>' for name, url in docs]
-    text = "<b>📎 Документы:</b>\n" + "\n".join(lines)
+    await asyncio.gather(*(guarded(*row) for row in due))
+    if due:
+        logger.info(f"Дайджесты: отправлено {len(due)} за час {hour}:00 UTC")
 
-    await context.bot.send_message(
-        chat_id=q.message.chat_id,
-        text=text,
-        parse_mode="HTML",
-        disable_web_page_preview=True,
-        reply_to_message_id=q.message.message_id
+
+def digest_settings_markup(user_id: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    rows = get_delivery_modes(user_id)
+    if not rows:
+        return "🔕 У вас нет активных подписок.", None
+    lines, buttons = [], []
+    for key, name, mode, hour in rows:
+        title = html.escape(name or key)
+        when = f" в {hour:02d}:00 UTC" if mode == DAILY else ""
+        lines.append(f"🔔 {title} — {MODE_LABELS.get(mode, mode)}{when}")
+        buttons.append([
+            InlineKeyboardButton(("✅ " if mode == m else "") + label, callback_data=f"digest:{m}:{key}")
+            for m, label in ((INSTANT, "⚡ Сразу"), (HOURLY, "🕐 Час"), (DAILY, "📅 День"))
+        ])
+    text = (
+        "🗞 <b>Доставка уведомлений по подпискам</b>\n\n" + "\n".join(lines) +
+        "\n\nВ режиме дайджеста новые тендеры копятся и приходят одним сообщением "
+        "(много тендеров — Excel-файлом). Час ежедневного дайджеста: /digest &lt;час UTC&gt;."
     )
+    return text, InlineKeyboardMarkup(buttons)
 
 
+# --- Команда /digest — режим доставки подписок ---
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if context.args:
+        try:
+            hour = int(context.args[0])
+            if not 0 <= hour <= 23:
+                raise ValueError
+        except ValueError:
+            return await update.message.reply_text("Укажите час от 0 до 23, например: /digest 9")
+        set_digest_hour(user_id, hour)
+    text, kb = digest_settings_markup(user_id)
+    await update.message.reply_text(text, parse_mode="HTML", reply_markup=kb)
+
+
+async def digest_mode_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    _, mode, key = q.data.split(":", 2)
+    user_id = q.from_user.id
+    set_delivery_mode(user_id, key, mode)
+    if mode == INSTANT:
+        # накопленные тендеры уже отмечены отправленными — досылаем их сразу, иначе они потеряются
+        try:
+            await send_digest(context.bot, user_id, key, get_key_name(user_id, key))
+        except Exception:
+            logger.exception(f"Не удалось отправить дайджест по ключу {key} пользователю {user_id}")
+    text, kb = digest_settings_markup(user_id)
+    await q.edit_message_text(text, parse_mode="HTML", reply_markup=kb)
+
 
 def get_key_name(user_id: int, key: str) -> str:
     """
@@ -1095,10 +1565,7 @@ async def refresh_keys_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 1) Получаем сводный список ключей из TenderPlan
     try:
-        resp = requests.get(f"{API_URL}/keys/getall", headers=get_headers())
-        resp.raise_for_status()
-        payload = resp.json()
-        remote = payload if isinstance(payload, list) else payload.get("keys", []) or payload.get("data", [])
+        remote = await get_client().get_keys()
     except Exception as e:
         logger.exception("Не удалось скачать ключи из TenderPlan")
         return await q.edit_message_text(f"❌ Ошибка при получении ключей: {e}")
@@ -1132,12 +1599,31 @@ async def refresh_keys_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ASK_EXISTING
 
 
+# Строит фильтр sent_tenders до первого опроса: чтение всей таблицы — в отдельном потоке, не в event loop.
+async def on_startup(app):
+    await asyncio.to_thread(sent_filter.rebuild)
+
+
+# Закрывает пул соединений Tenderplan API при остановке бота.
+async def on_shutdown(app):
+    await report_jobs.shutdown()
+    await outbound.shutdown()
+    await close_client()
+    close_connections()
+    stop_metrics_server()
+
+
 if __name__ == '__main__':
+    # создаём недостающие таблицы и колонки до старта бота
+    init_db()
+    # /metrics для Prometheus, если задан METRICS_PORT
+    start_metrics_server()
     request = HTTPXRequest(
     connection_pool_size=50,
     pool_timeout=10.0            
     )
-    app = (ApplicationBuilder().token(BOT_TOKEN).request(request).build())
+    app = (ApplicationBuilder().token(BOT_TOKEN).request(request)
+           .post_init(on_startup).post_shutdown(on_shutdown).build())
 
     # ОЧИЩАЕМ ВСЕ КОМАНДЫ ОДИН РАЗ
     asyncio.get_event_loop().run_until_complete(app.bot.set_my_commands([]))
@@ -1149,6 +1635,8 @@ if __name__ == '__main__':
             BotCommand("export", "Выгрузить тендеры по активному ключу"),
             BotCommand("keys",   "Управление ключами"),
             BotCommand("subscriptions", "Мои подписки"),
+            BotCommand("reports", "Мои отчёты"),
+            BotCommand("digest", "Дайджесты подписок"),
             BotCommand("help",   "Показать справку по командам"),
         ])
     )
@@ -1170,7 +1658,7 @@ if __name__ == '__main__':
             CommandHandler("export", export_choice_cb),
             CallbackQueryHandler(ask_existing,    pattern="^(has_existing|no_existing)$"),
             CallbackQueryHandler(refresh_keys_cb, pattern="^refresh_keys$"),
-            CallbackQueryHandler(export_to_messages_cb, pattern="^export_msgs$"),
+            CallbackQueryHandler(export_to_messages_cb, pattern="^export_msgs(_compact)?$"),
             CallbackQueryHandler(export_tenders,pattern="^export_excel$"),
             CallbackQueryHandler(cancel_export_cb,      pattern="^cancel_export$"),
             CallbackQueryHandler(select_key_cb,   pattern=r"^select(_key)?_\d+$"),
@@ -1193,6 +1681,10 @@ if __name__ == '__main__':
     app.add_handler(CommandHandler("keys",  keys_command))
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("subscriptions", show_user_subscriptions))
+    app.add_handler(CommandHandler("reports", show_report_jobs))
+    app.add_handler(CommandHandler("digest", digest_command))
+    app.add_handler(CommandHandler("profile", profile_command))
+    app.add_handler(CallbackQueryHandler(digest_mode_cb, pattern=r"^digest:(instant|hourly|daily):.+$"))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("export", export_choice_cb))
     app.add_handler(CallbackQueryHandler(subscribe_cb, pattern=r"^subscribe_.+$"))
@@ -1202,7 +1694,7 @@ if __name__ == '__main__':
    # ✅ Универсальный паттерн для выбора ключа (и для /start, и для /export):
     app.add_handler(CallbackQueryHandler(select_key_cb, pattern=r"^select(_key)?_.+$"))
     app.add_handler(CallbackQueryHandler(ask_existing, pattern="^has_existing$"))
-    app.add_handler(CallbackQueryHandler(export_to_messages_cb, pattern="^export_msgs$"))
+    app.add_handler(CallbackQueryHandler(export_to_messages_cb, pattern="^export_msgs(_compact)?$"))
     app.add_handler(CallbackQueryHandler(show_attachments_cb, pattern=r"^show_atts:"))
     app.add_handler(CallbackQueryHandler(go_start_cb, pattern="^go_start$"))
     app.add_handler(CallbackQueryHandler(export_tenders,pattern="^export_excel$"))
@@ -1210,12 +1702,17 @@ if __name__ == '__main__':
     app.add_handler(CallbackQueryHandler(cancel_export_cb, pattern="^cancel_export$", block=False))
     app.add_handler(CallbackQueryHandler(delete_key_cb, pattern=r"^delete_key_.+$"))    # первый шаг
     app.add_handler(CallbackQueryHandler(delete_key_confirm_cb, pattern=r"^del_.+$")) # подтверждение
-    app.add_handler(CallbackQueryHandler(show_attachments_sub_cb, pattern=r"^show_sub_atts:"))
+    app.add_handler(CallbackQueryHandler(show_attachments_cb, pattern=r"^show_sub_atts:"))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, enter_key))
 
     app.add_handler(CallbackQueryHandler(choose_export_format_cb, pattern="^choose_export_format$"))
 
     app.add_error_handler(error_handler)
-    # запустим job каждые 30 минут
-    app.job_queue.run_repeating(check_new_tenders, interval=1800, first=10)
+    # запустим job каждые POLL_INTERVAL секунд (по умолчанию 30 минут)
+    app.job_queue.run_repeating(check_new_tenders, interval=POLL_INTERVAL, first=10)
+    # чистка и сжатие базы раз в сутки
+    app.job_queue.run_daily(maintain_database, time=dtime(hour=DB_MAINTENANCE_HOUR))
+    # дайджесты — в начале каждого часа
+    now = datetime.now()
+    app.job_queue.run_repeating(send_digests, interval=3600, first=3600 - now.minute * 60 - now.second)
     app.run_polling()
\ No newline at end of file